@@ -0,0 +1,1086 @@
+import argparse
+import bisect
+import contextlib
+import gc
+import heapq
+import io
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+import time
+import tracemalloc
+from array import array
+
+import gator_taxi
+import ingest
+from gator_taxi import (DurableGatorTaxi, GatorTaxi, HEAP_BACKENDS, INDEX_BACKENDS, MinHeap, MinHeapNode,
+                        OP_CANCEL_RIDE, OP_GET_NEXT_RIDE, OP_COUNT_RIDES, OP_GET_NEXT_RIDES, OP_INSERT,
+                        OP_PEEK_NEXT_RIDE, OP_PRINT, OP_PRINT_BY_COST, OP_PRINT_RANGE, OP_REPRICE, OP_TOP_RIDES,
+                        OP_UPDATE_TRIP, OutputSink, RBTNode, RedBlackTree, Ride, iter_commands)
+
+
+def build_heap(size, rng):
+    # Fill a heap with size rides of random cost and trip duration
+    heap = MinHeap()
+    nodes = []
+    for ride_num in range(1, size + 1):
+        node = MinHeapNode(Ride(ride_num, rng.randint(1, 1000), rng.randint(1, 1000)), None, heap.curr_size + 1)
+        heap.insert(node)
+        nodes.append(node)
+    return heap, nodes
+
+
+def bench_heap_removal(sizes, ops, seed):
+    """
+    Time MinHeap.pop and MinHeap.delete_element (the GetNextRide and CancelRide paths) on heaps of growing size.
+    With O(log n) removal the cost per operation should stay nearly flat as the heap grows.
+    """
+    print(f"{'size':>10} {'pop us/op':>12} {'cancel us/op':>14}")
+    for size in sizes:
+        rng = random.Random(seed)
+
+        # Pop ops rides from the top of the heap
+        heap, _ = build_heap(size, rng)
+        count = min(ops, size)
+        start = time.perf_counter()
+        for _ in range(count):
+            heap.pop()
+        pop_cost = (time.perf_counter() - start) / count * 1e6
+
+        # Delete ops rides from random positions in the heap
+        heap, nodes = build_heap(size, rng)
+        victims = rng.sample(nodes, count)
+        start = time.perf_counter()
+        for node in victims:
+            heap.delete_element(node.min_heap_index)
+        cancel_cost = (time.perf_counter() - start) / count * 1e6
+
+        print(f"{size:>10} {pop_cost:>12.2f} {cancel_cost:>14.2f}")
+
+
+def bench_heap_ops(sizes, ops, seed):
+    """
+    Micro-benchmark of the three heap hot paths: insert into, pop from and update_element in a heap of each size.
+    Each operation is timed ops times against a heap that already holds size rides.
+    """
+    print(f"{'size':>10} {'insert us/op':>14} {'pop us/op':>12} {'update us/op':>14}")
+    for size in sizes:
+        rng = random.Random(seed)
+        heap, nodes = build_heap(size, rng)
+        count = min(ops, size)
+
+        # Insert count more rides
+        extra = [MinHeapNode(Ride(size + i + 1, rng.randint(1, 1000), rng.randint(1, 1000)), None, 0)
+                 for i in range(count)]
+        start = time.perf_counter()
+        for node in extra:
+            node.min_heap_index = heap.curr_size + 1
+            heap.insert(node)
+        insert_cost = (time.perf_counter() - start) / count * 1e6
+
+        # Change the trip duration of count random rides (both shorter and longer)
+        victims = rng.sample(nodes, count)
+        new_keys = [rng.randint(1, 1000) for _ in range(count)]
+        start = time.perf_counter()
+        for node, new_key in zip(victims, new_keys):
+            heap.update_element(node.min_heap_index, new_key)
+        update_cost = (time.perf_counter() - start) / count * 1e6
+
+        # Pop count rides
+        start = time.perf_counter()
+        for _ in range(count):
+            heap.pop()
+        pop_cost = (time.perf_counter() - start) / count * 1e6
+
+        print(f"{size:>10} {insert_cost:>14.2f} {pop_cost:>12.2f} {update_cost:>14.2f}")
+
+
+def command_mix(size, inserts, updates, cancels, next_rides, seed):
+    """
+    Build size (opcode, args) commands drawn with the given relative weights.
+    Updates shorten the trip three times out of four, so the mix is decrease-key heavy like UpdateTrip traffic.
+    """
+    rng = random.Random(seed)
+    active = []
+    next_ride_num = 1
+    commands = []
+    kinds = rng.choices([OP_INSERT, OP_UPDATE_TRIP, OP_CANCEL_RIDE, OP_GET_NEXT_RIDE],
+                        [inserts, updates, cancels, next_rides], k=size)
+    for kind in kinds:
+        if kind == OP_INSERT or not active:
+            commands.append((OP_INSERT, (next_ride_num, rng.randint(1, 1000), rng.randint(10, 1000))))
+            active.append(next_ride_num)
+            next_ride_num += 1
+        elif kind == OP_UPDATE_TRIP:
+            new_duration = rng.randint(1, 400) if rng.random() < 0.75 else rng.randint(400, 1500)
+            commands.append((OP_UPDATE_TRIP, (rng.choice(active), new_duration)))
+        elif kind == OP_CANCEL_RIDE:
+            commands.append((OP_CANCEL_RIDE, (active.pop(rng.randrange(len(active))),)))
+        else:
+            commands.append((OP_GET_NEXT_RIDE, ()))
+    return commands
+
+
+def bench_heap_backends(size, inserts, updates, cancels, next_rides, seed):
+    """
+    Run the same command mix through a GatorTaxi with every heap backend and report the fastest one.
+    """
+    commands = command_mix(size, inserts, updates, cancels, next_rides, seed)
+    timings = {}
+    print(f"{'backend':<10} {'seconds':>10} {'kops/s':>10}")
+    for name in sorted(HEAP_BACKENDS):
+        engine = GatorTaxi(OutputSink(io.StringIO()), name)
+        # UpdateTrip on an already cancelled ride prints an empty line to stdout, keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            engine.run(commands)
+            timings[name] = time.perf_counter() - start
+        print(f"{name:<10} {timings[name]:>10.3f} {size / timings[name] / 1000:>10.1f}")
+    print(f"fastest: {min(timings, key=timings.get)}")
+
+
+def bench_wal(size, sync_every, seed):
+    """
+    Per-command cost of the same command mix with and without the write-ahead log.
+    """
+    commands = command_mix(size, 4, 4, 1, 1, seed)
+    with tempfile.TemporaryDirectory() as directory:
+        engines = [("in-memory", GatorTaxi(OutputSink(io.StringIO()))),
+                   ("wal", DurableGatorTaxi(OutputSink(io.StringIO()), path_prefix=os.path.join(directory, "bench"),
+                                            sync_every=sync_every))]
+        print(f"{'engine':<10} {'us/command':>12}")
+        for name, engine in engines:
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                engine.run(commands)
+                if name == "wal":
+                    engine.close()
+                elapsed = time.perf_counter() - start
+            print(f"{name:<10} {elapsed / size * 1e6:>12.2f}")
+
+
+def bench_lazy_cancel(size, cancels, fractions, seed):
+    """
+    Run the same cancel-heavy command mix with eager CancelRide and with tombstones compacted at each of the
+    given dead fractions, for every heap backend.
+    """
+    commands = command_mix(size, 4, 2, cancels, 1, seed)
+    print(f"{'backend':<10} {'cancel':<8} {'seconds':>10} {'kops/s':>10}")
+    for name in sorted(HEAP_BACKENDS):
+        for fraction in [None, *fractions]:
+            engine = GatorTaxi(OutputSink(io.StringIO()), name, max_dead_fraction=fraction)
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                engine.run(commands)
+                elapsed = time.perf_counter() - start
+            label = "eager" if fraction is None else f"{fraction:g}"
+            print(f"{name:<10} {label:<8} {elapsed:>10.3f} {size / elapsed / 1000:>10.1f}")
+
+
+def bench_index(size, lookups, widths, seed):
+    """
+    Per-operation cost of every ordered index backend on a dispatcher holding size rides: Inserts one at a time,
+    point lookups (half of them misses), Print(low, high) over ranges of each width written to an in-memory
+    sink, and CancelRides.
+    """
+    rng = random.Random(seed)
+    # Random ride_nums spread over four times their number, so lookups and range bounds hit gaps too
+    ride_nums = rng.sample(range(1, 4 * size + 1), size)
+    rides = [(ride_num, rng.randint(1, 1000), rng.randint(10, 1000)) for ride_num in ride_nums]
+    keys = [rng.choice(ride_nums) if rng.random() < 0.5 else rng.randint(1, 4 * size) for _ in range(lookups)]
+    cancels = rng.sample(ride_nums, min(lookups, size))
+
+    header = f"{'index':<8} {'insert us':>10} {'lookup us':>10}"
+    header += "".join(f" {f'Print({width}) us':>16}" for width in widths)
+    print(header + f" {'cancel us':>10}")
+    for name in sorted(INDEX_BACKENDS):
+        engine = GatorTaxi(OutputSink(io.StringIO()), "binary", index=name)
+        gc.collect()
+        gc.disable()
+        timings = []
+
+        start = time.perf_counter()
+        for details in rides:
+            engine.insert(*details)
+        timings.append((time.perf_counter() - start) / size)
+
+        get_ride = engine.rbt.get_ride
+        start = time.perf_counter()
+        for key in keys:
+            get_ride(key)
+        timings.append((time.perf_counter() - start) / lookups)
+
+        for width in widths:
+            # The ride_nums are spread over 4 * size, so a range of this width holds about width / 4 rides
+            lows = [rng.randint(1, max(4 * size - width, 1)) for _ in range(max(lookups // width, 10))]
+            start = time.perf_counter()
+            for low in lows:
+                engine.print_rides(low, low + width)
+            timings.append((time.perf_counter() - start) / len(lows))
+            # Keep the output from growing across the widths
+            engine.sink = OutputSink(io.StringIO())
+
+        start = time.perf_counter()
+        for ride_num in cancels:
+            engine.cancel_ride(ride_num)
+        timings.append((time.perf_counter() - start) / len(cancels))
+        gc.enable()
+
+        line = f"{name:<8} {timings[0] * 1e6:>10.2f} {timings[1] * 1e6:>10.2f}"
+        line += "".join(f" {timing * 1e6:>16.1f}" for timing in timings[2:-1])
+        print(line + f" {timings[-1] * 1e6:>10.2f}")
+
+
+def bench_range_cache(size, windows, width, prints_per_change, capacities, seed):
+    """
+    Per-command cost of a monitoring-style mix on a dispatcher holding size rides: Print(low, high) over a
+    fixed set of windows of the given width, with one UpdateTrip or CancelRide of a random ride every
+    prints_per_change Prints, without a RangeCache and with each capacity.
+    """
+    rng = random.Random(seed)
+    rides = [(ride_num, rng.randint(1, 1000), rng.randint(10, 1000)) for ride_num in range(1, size + 1)]
+    lows = [rng.randint(1, max(size - width, 1)) for _ in range(windows)]
+    commands = []
+    for count in range(200000):
+        low = rng.choice(lows)
+        commands.append((OP_PRINT_RANGE, (low, low + width - 1)))
+        if count % prints_per_change == 0:
+            ride_num = rng.randint(1, size)
+            if rng.random() < 0.8:
+                commands.append((OP_UPDATE_TRIP, (ride_num, rng.randint(1, 400))))
+            else:
+                commands.append((OP_CANCEL_RIDE, (ride_num,)))
+
+    print(f"{'cache':>6} {'us/command':>11} {'hit rate':>9}")
+    for capacity in [0, *capacities]:
+        engine = GatorTaxi(OutputSink(io.StringIO()), range_cache=capacity)
+        engine.load_rides(rides)
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            engine.run(commands)
+            elapsed = time.perf_counter() - start
+        cache = engine.rbt.range_cache
+        hit_rate = f"{cache.hits / (cache.hits + cache.misses):.2f}" if cache else "-"
+        print(f"{capacity:>6} {elapsed / len(commands) * 1e6:>11.2f} {hit_rate:>9}")
+
+
+def bench_update_batch(size, batches, seed):
+    """
+    Per-update cost of a burst of UpdateTrips applied one command at a time versus through GatorTaxi.update_many,
+    on a dispatcher holding size rides, for every heap backend and burst size.
+    """
+    rng = random.Random(seed)
+    rides = [(ride_num, rng.randint(1, 1000), rng.randint(10, 1000)) for ride_num in range(1, size + 1)]
+    print(f"{'backend':<10} {'updates':>9} {'one by one us':>14} {'update_many us':>15}")
+    for name in sorted(HEAP_BACKENDS):
+        for batch in batches:
+            # Shorter trips three times out of four, as in command_mix, so all three outcomes occur
+            updates = [(rng.randint(1, size), rng.randint(1, 400) if rng.random() < 0.75 else rng.randint(400, 1500))
+                       for _ in range(batch)]
+            timings = []
+            for apply in ("update_trip", "update_many"):
+                engine = GatorTaxi(OutputSink(io.StringIO()), name)
+                engine.load_rides(rides)
+                # A full collection of the previous dispatcher's nodes would land in whichever run comes next
+                gc.collect()
+                gc.disable()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    start = time.perf_counter()
+                    if apply == "update_trip":
+                        for ride_num, new_duration in updates:
+                            engine.update_trip(ride_num, new_duration)
+                    else:
+                        engine.update_many(updates)
+                    timings.append(time.perf_counter() - start)
+                gc.enable()
+            print(f"{name:<10} {batch:>9} {timings[0] / batch * 1e6:>14.2f} {timings[1] / batch * 1e6:>15.2f}")
+
+
+class DictRide:
+    # Ride laid out the way it was before __slots__, with a per-instance __dict__
+    def __init__(self, ride_num, cost_ride, triptime):
+        self.ride_num = ride_num
+        self.cost_ride = cost_ride
+        self.triptime = triptime
+
+
+class DictMinHeapNode:
+    def __init__(self, ride, rbt_node, min_heap_index):
+        self.ride = ride
+        self.rbt_node = rbt_node
+        self.min_heap_index = min_heap_index
+
+
+class DictRBTNode:
+    def __init__(self, ride, min_heap_node):
+        self.ride = ride
+        self.pp = None
+        self.left = None
+        self.right = None
+        self.color = 1
+        self.min_heap_node = min_heap_node
+
+
+def allocated_bytes(build, size):
+    # Bytes still allocated after build(size) returns what it created
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    keep = build(size)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del keep
+    return after - before
+
+
+def build_dict_objects(size):
+    # Per-ride objects of the old insert_ride: Ride, MinHeapNode, RBTNode and the unused RBTNode(None, None)
+    objects = []
+    for ride_num in range(size):
+        ride = DictRide(ride_num, ride_num % 1000, ride_num % 997)
+        heap_node = DictMinHeapNode(ride, DictRBTNode(None, None), ride_num + 1)
+        objects.append((ride, heap_node, DictRBTNode(ride, heap_node)))
+    return objects
+
+
+def build_slotted_objects(size):
+    # Per-ride objects of the current insert_ride: slotted Ride, MinHeapNode and RBTNode
+    objects = []
+    for ride_num in range(size):
+        ride = Ride(ride_num, ride_num % 1000, ride_num % 997)
+        heap_node = MinHeapNode(ride, None, ride_num + 1)
+        heap_node.rbt_node = RBTNode(ride, heap_node)
+        objects.append((ride, heap_node, heap_node.rbt_node))
+    return objects
+
+
+def build_engine(size):
+    # A dispatcher holding size rides inserted through the normal command path
+    engine = GatorTaxi()
+    for ride_num in range(size):
+        engine.insert(ride_num, ride_num % 1000, ride_num % 997)
+    return engine
+
+
+def bench_memory(size):
+    """
+    Compare the memory held per ride by the old __dict__ based nodes and the slotted nodes.
+    The tuple/list holding the objects is counted in both object layouts.
+    """
+    dict_bytes = allocated_bytes(build_dict_objects, size)
+    slot_bytes = allocated_bytes(build_slotted_objects, size)
+    engine_bytes = allocated_bytes(build_engine, size)
+    print(f"{'layout':<28} {'bytes/ride':>12}")
+    print(f"{'__dict__ nodes (old)':<28} {dict_bytes / size:>12.1f}")
+    print(f"{'slotted nodes':<28} {slot_bytes / size:>12.1f}")
+    print(f"{'GatorTaxi engine (slotted)':<28} {engine_bytes / size:>12.1f}")
+
+
+# Operations of a synthetic workload; PrintRange is Print(low, high)
+WORKLOAD_OPS = ("Insert", "Print", "PrintRange", "UpdateTrip", "GetNextRide", "CancelRide", "CountRides",
+                "PeekNextRide", "TopRides", "GetNextRides", "PrintByCost", "Reprice")
+DEFAULT_MIX = "Insert=40,Print=10,PrintRange=5,UpdateTrip=25,GetNextRide=10,CancelRide=10"
+KEY_DISTRIBUTIONS = ("sequential", "uniform", "hotspot")
+
+# Share of the lookups that go to the hot tenth of the ride_num space in the hotspot distribution
+HOTSPOT_SHARE = 0.9
+
+
+def parse_mix(text):
+    # "Insert=40,GetNextRide=10,..." -> weights in WORKLOAD_OPS order, missing operations weigh 0
+    weights = dict.fromkeys(WORKLOAD_OPS, 0.0)
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        if name.strip() not in weights:
+            raise argparse.ArgumentTypeError(f"unknown operation in mix: {name.strip()}")
+        weights[name.strip()] = float(weight)
+    return [weights[name] for name in WORKLOAD_OPS]
+
+
+def parse_mix_option(text):
+    # Validate --mix while parsing the command line, the workload functions take the text itself
+    parse_mix(text)
+    return text
+
+
+def generate_workload(size, seed=1, mix=DEFAULT_MIX, distribution="uniform", range_width=100,
+                      update_split=(60, 30, 10)):
+    """
+    Lazily yield size command lines in the input file syntax, e.g. "Insert(5,50,120)".
+
+    The generator keeps its own model of the active rides, so Inserts never reuse an active ride_num and
+    UpdateTrip/CancelRide/Print mostly name rides that exist. Every trip duration it emits is distinct, so no
+    two rides ever share a (cost, triptime) key and the GetNextRide order is fully determined.
+
+    Parameters:
+    size (int): Number of commands.
+    seed (int): Seed of the random generator, the same arguments always give the same workload.
+    mix (str): Relative weight of each of WORKLOAD_OPS, e.g. "Insert=40,GetNextRide=10".
+    distribution (str): How ride_nums are chosen, one of KEY_DISTRIBUTIONS: ascending ride_nums, uniform over
+        the ride_num space, or mostly (HOTSPOT_SHARE) within its first tenth.
+    range_width (int): Number of ride_nums covered by each Print(low, high) and CountRides(low, high).
+    update_split (tuple): Relative weights of UpdateTrips that shorten the trip, lengthen it by at most 2x
+        (repricing the ride) and lengthen it beyond 2x (cancelling the ride).
+    """
+    rng = random.Random(seed)
+    weights = parse_mix(mix) if isinstance(mix, str) else list(mix)
+    key_space = 2 * max(size, 1)
+    hot_space = max(key_space // 10, 1)
+    # Trip durations are (random factor * stride + serial), distinct because serial never reaches stride
+    stride = size + 1
+    serial = 0
+
+    # Model of the active rides: ride_num -> (cost, triptime), a list for uniform picks and a lazy heap of keys
+    rides = {}
+    active = []
+    position = {}
+    queue = []
+    next_ride_num = 0
+
+    def add(ride_num, cost, triptime):
+        rides[ride_num] = (cost, triptime)
+        position[ride_num] = len(active)
+        active.append(ride_num)
+        heapq.heappush(queue, (cost, triptime, ride_num))
+
+    def remove(ride_num):
+        del rides[ride_num]
+        last = active.pop()
+        index = position.pop(ride_num)
+        if last != ride_num:
+            active[index] = last
+            position[last] = index
+
+    def draw_key():
+        # A ride_num from the distribution, not necessarily an active one
+        if distribution == "hotspot" and rng.random() < HOTSPOT_SHARE:
+            return rng.randint(1, hot_space)
+        if distribution == "sequential":
+            return rng.randint(1, max(next_ride_num, 1))
+        return rng.randint(1, key_space)
+
+    def pick_ride():
+        # An existing ride for sequential/uniform, a hot ride_num (which may be inactive) for hotspot
+        if distribution == "hotspot" or not active:
+            return draw_key()
+        return active[rng.randrange(len(active))]
+
+    kinds = range(len(WORKLOAD_OPS))
+    for _ in range(size):
+        kind = WORKLOAD_OPS[rng.choices(kinds, weights)[0]]
+
+        if kind == "Insert" or (kind in ("UpdateTrip", "CancelRide") and not active):
+            if distribution == "sequential":
+                next_ride_num += 1
+                ride_num = next_ride_num
+            else:
+                ride_num = draw_key()
+                while ride_num in rides:
+                    ride_num = rng.randint(1, key_space)
+            serial += 1
+            cost, triptime = rng.randint(1, 1000), rng.randint(1, 1000) * stride + serial
+            add(ride_num, cost, triptime)
+            yield f"Insert({ride_num},{cost},{triptime})"
+
+        elif kind == "Print":
+            yield f"Print({pick_ride()})"
+
+        elif kind == "PrintRange":
+            low = draw_key()
+            yield f"Print({low},{low + range_width - 1})"
+
+        elif kind == "CountRides":
+            low = draw_key()
+            yield f"CountRides({low},{low + range_width - 1})"
+
+        elif kind == "PeekNextRide":
+            yield "PeekNextRide()"
+
+        elif kind == "PrintByCost":
+            low = rng.randint(1, 1000)
+            yield f"PrintByCost({low},{low + rng.randint(0, 20)})"
+
+        elif kind == "Reprice":
+            low, delta = rng.randint(1, 1000), rng.randint(-20, 20)
+            high = low + rng.randint(0, 50)
+            for ride_num, (cost, triptime) in list(rides.items()):
+                if low <= cost <= high:
+                    rides[ride_num] = (cost + delta, triptime)
+                    heapq.heappush(queue, (cost + delta, triptime, ride_num))
+            yield f"Reprice({low},{high},{delta})"
+
+        elif kind == "TopRides":
+            yield f"TopRides({rng.randint(1, 20)})"
+
+        elif kind == "UpdateTrip":
+            ride_num = pick_ride()
+            old_triptime = rides[ride_num][1] if ride_num in rides else rng.randint(1, 1000) * stride
+            branch = rng.choices((0, 1, 2), update_split)[0]
+            factor = (rng.uniform(0.2, 1.0), rng.uniform(1.0, 2.0), rng.uniform(2.0, 4.0))[branch]
+            serial += 1
+            new_triptime = int(old_triptime * factor) // stride * stride + serial
+            yield f"UpdateTrip({ride_num},{new_triptime})"
+
+            # Follow the dispatcher's rules, the rounding above may have moved the duration to another branch
+            if ride_num in rides:
+                cost = rides[ride_num][0]
+                remove(ride_num)
+                if new_triptime <= old_triptime:
+                    add(ride_num, cost, new_triptime)
+                elif new_triptime <= 2 * old_triptime:
+                    add(ride_num, cost + 10, new_triptime)
+
+        elif kind in ("GetNextRide", "GetNextRides"):
+            count = 1 if kind == "GetNextRide" else rng.randint(1, 50)
+            for _ in range(count):
+                # Drop heap entries of rides that were cancelled or updated since they were pushed
+                while queue and rides.get(queue[0][2]) != queue[0][:2]:
+                    heapq.heappop(queue)
+                if queue:
+                    remove(heapq.heappop(queue)[2])
+            yield "GetNextRide()" if kind == "GetNextRide" else f"GetNextRides({count})"
+
+        else:
+            ride_num = pick_ride()
+            if ride_num in rides:
+                remove(ride_num)
+            yield f"CancelRide({ride_num})"
+
+
+def write_workload(path, size, seed, mix, distribution, range_width, update_split):
+    with open(path, "w") as workload_file:
+        for line in generate_workload(size, seed, mix, distribution, range_width, update_split):
+            workload_file.write(line)
+            workload_file.write("\n")
+
+
+class ReferenceDispatcher:
+    """
+    Deliberately simple model of the dispatcher used to check the real one: a dict of rides, a sorted list
+    of ride_nums for the ranges and a heapq with lazy deletion for GetNextRide.
+    """
+
+    def __init__(self, output):
+        self.output = output
+        self.rides = {}
+        self.ride_nums = []
+        self.queue = []
+
+    def write(self, ride_num):
+        cost, triptime = self.rides[ride_num]
+        return f"({ride_num},{cost},{triptime})"
+
+    def add(self, ride_num, cost, triptime):
+        self.rides[ride_num] = (cost, triptime)
+        heapq.heappush(self.queue, (cost, triptime, ride_num))
+
+    def remove(self, ride_num):
+        del self.rides[ride_num]
+        del self.ride_nums[bisect.bisect_left(self.ride_nums, ride_num)]
+
+    def run(self, commands):
+        # Returns False if the run stopped at a duplicate Insert
+        for opcode, args in commands:
+            if opcode == OP_INSERT:
+                ride_num, cost, triptime = args
+                if ride_num in self.rides:
+                    self.output.write("Duplicate ride_num\n")
+                    return False
+                self.add(ride_num, cost, triptime)
+                bisect.insort(self.ride_nums, ride_num)
+            elif opcode == OP_PRINT:
+                self.output.write(self.write(args[0]) if args[0] in self.rides else "(0,0,0)")
+                self.output.write("\n")
+            elif opcode == OP_PRINT_RANGE:
+                low, high = args
+                start, end = bisect.bisect_left(self.ride_nums, low), bisect.bisect_right(self.ride_nums, high)
+                self.output.write(",".join(self.write(ride_num) for ride_num in self.ride_nums[start:end])
+                                  or "(0,0,0)")
+                self.output.write("\n")
+            elif opcode == OP_COUNT_RIDES:
+                low, high = args
+                count = bisect.bisect_right(self.ride_nums, high) - bisect.bisect_left(self.ride_nums, low)
+                self.output.write(f"{max(count, 0)}\n")
+            elif opcode in (OP_GET_NEXT_RIDE, OP_GET_NEXT_RIDES):
+                # GetNextRides(n) answers like n GetNextRide commands
+                for _ in range(args[0] if args else 1):
+                    while self.queue and self.rides.get(self.queue[0][2]) != self.queue[0][:2]:
+                        heapq.heappop(self.queue)
+                    if not self.queue:
+                        self.output.write("No active ride requests\n")
+                        continue
+                    ride_num = heapq.heappop(self.queue)[2]
+                    self.output.write(self.write(ride_num) + "\n")
+                    self.remove(ride_num)
+            elif opcode == OP_PRINT_BY_COST:
+                low, high = args
+                band = sorted((cost, triptime, ride_num) for ride_num, (cost, triptime) in self.rides.items()
+                              if low <= cost <= high)
+                self.output.write(",".join(self.write(ride_num) for _, _, ride_num in band) or "(0,0,0)")
+                self.output.write("\n")
+            elif opcode == OP_REPRICE:
+                low, high, delta = args
+                for ride_num, (cost, triptime) in list(self.rides.items()):
+                    if low <= cost <= high:
+                        self.add(ride_num, cost + delta, triptime)
+            elif opcode in (OP_PEEK_NEXT_RIDE, OP_TOP_RIDES):
+                k = args[0] if args else 1
+                cheapest = heapq.nsmallest(k, ((cost, triptime, ride_num)
+                                               for ride_num, (cost, triptime) in self.rides.items()))
+                self.output.write(",".join(self.write(ride_num) for _, _, ride_num in cheapest)
+                                  or "No active ride requests")
+                self.output.write("\n")
+            elif opcode == OP_CANCEL_RIDE:
+                if args[0] in self.rides:
+                    self.remove(args[0])
+            elif opcode == OP_UPDATE_TRIP:
+                ride_num, new_duration = args
+                if ride_num not in self.rides:
+                    continue
+                cost, triptime = self.rides[ride_num]
+                if new_duration <= triptime:
+                    self.add(ride_num, cost, new_duration)
+                elif new_duration <= 2 * triptime:
+                    self.add(ride_num, cost + 10, new_duration)
+                else:
+                    self.remove(ride_num)
+        return True
+
+
+def reference_output(workload_path, output_path):
+    with open(workload_path) as workload_file, open(output_path, "w") as output:
+        ReferenceDispatcher(output).run(iter_commands(workload_file))
+
+
+def load_commands(workload_path):
+    with open(workload_path) as workload_file:
+        return list(iter_commands(workload_file))
+
+
+def replay_heap(workload_path, heap):
+    """
+    Replay the priority queue side of a workload against a bare heap backend: Insert, GetNextRide(s) (pop),
+    PeekNextRide, TopRides, CancelRide, the three UpdateTrip outcomes and Reprice (the repriced rides are found
+    outside of the timed region). Returns the operation count, the elapsed seconds and the per-operation latencies
+    in nanoseconds.
+    """
+    commands = load_commands(workload_path)
+    heap = HEAP_BACKENDS[heap]()
+    nodes = {}
+    latencies = array("q")
+    clock = time.perf_counter_ns
+
+    start = time.perf_counter()
+    for opcode, args in commands:
+        if opcode == OP_INSERT:
+            begin = clock()
+            node = heap.new_node(Ride(*args))
+            heap.insert(node)
+            latencies.append(clock() - begin)
+            nodes[args[0]] = node
+        elif opcode == OP_GET_NEXT_RIDE:
+            begin = clock()
+            node = heap.pop() if heap.curr_size else None
+            latencies.append(clock() - begin)
+            if node is not None:
+                del nodes[node.ride.ride_num]
+        elif opcode == OP_GET_NEXT_RIDES:
+            begin = clock()
+            popped = [heap.pop() for _ in range(min(args[0], heap.curr_size))]
+            latencies.append(clock() - begin)
+            for node in popped:
+                del nodes[node.ride.ride_num]
+        elif opcode in (OP_PEEK_NEXT_RIDE, OP_TOP_RIDES):
+            begin = clock()
+            if opcode == OP_PEEK_NEXT_RIDE:
+                heap.peek()
+            else:
+                heap.top_k(args[0])
+            latencies.append(clock() - begin)
+        elif opcode == OP_CANCEL_RIDE:
+            node = nodes.pop(args[0], None)
+            if node is not None:
+                begin = clock()
+                heap.delete_node(node)
+                latencies.append(clock() - begin)
+        elif opcode == OP_UPDATE_TRIP:
+            node = nodes.get(args[0])
+            if node is None:
+                continue
+            ride, new_duration = node.ride, args[1]
+            begin = clock()
+            if new_duration <= ride.triptime:
+                heap.update_node(node, new_duration)
+            elif new_duration <= 2 * ride.triptime:
+                heap.reprice_node(node, ride.cost_ride + 10, new_duration)
+            else:
+                heap.delete_node(node)
+            latencies.append(clock() - begin)
+            if new_duration > 2 * ride.triptime:
+                del nodes[args[0]]
+        elif opcode == OP_REPRICE:
+            low, high, delta = args
+            band = [node for node in nodes.values() if low <= node.ride.cost_ride <= high]
+            begin = clock()
+            heap.reprice_many(band, delta)
+            latencies.append(clock() - begin)
+    return len(latencies), time.perf_counter() - start, latencies
+
+
+def replay_tree(workload_path):
+    """
+    Replay the ride_num side of a workload against a bare RedBlackTree: insert, Print lookups, Print ranges,
+    CountRides and the deletions done by GetNextRide(s), CancelRide and cancelling UpdateTrips. The rides a
+    GetNextRide(s) removes are found with a heapq outside of the timed region.
+    """
+    commands = load_commands(workload_path)
+    rbt = RedBlackTree()
+    queue = []
+    latencies = array("q")
+    clock = time.perf_counter_ns
+
+    start = time.perf_counter()
+    for opcode, args in commands:
+        if opcode == OP_INSERT:
+            ride = Ride(*args)
+            begin = clock()
+            rbt.insert(ride, None)
+            latencies.append(clock() - begin)
+            heapq.heappush(queue, (ride.cost_ride, ride.triptime, ride.ride_num, ride))
+        elif opcode == OP_PRINT:
+            begin = clock()
+            rbt.get_ride(args[0])
+            latencies.append(clock() - begin)
+        elif opcode == OP_PRINT_RANGE:
+            begin = clock()
+            for _ in rbt.iter_range(*args):
+                pass
+            latencies.append(clock() - begin)
+        elif opcode == OP_COUNT_RIDES:
+            begin = clock()
+            rbt.count_range(*args)
+            latencies.append(clock() - begin)
+        elif opcode in (OP_GET_NEXT_RIDE, OP_GET_NEXT_RIDES):
+            # Skip entries of rides that were removed or whose key changed since they were pushed
+            victims = set()
+            while queue and len(victims) < (args[0] if args else 1):
+                cost, triptime, ride_num, ride = heapq.heappop(queue)
+                if ride.cost_ride == cost and ride.triptime == triptime and rbt.get_ride(ride_num) is not None:
+                    victims.add(ride_num)
+            if victims:
+                begin = clock()
+                if opcode == OP_GET_NEXT_RIDE:
+                    rbt.deleten(victims.pop())
+                else:
+                    rbt.delete_many(list(victims))
+                latencies.append(clock() - begin)
+        elif opcode == OP_CANCEL_RIDE:
+            begin = clock()
+            if rbt.get_ride(args[0]) is not None:
+                rbt.deleten(args[0])
+            latencies.append(clock() - begin)
+        elif opcode == OP_UPDATE_TRIP:
+            ride_num, new_duration = args
+            begin = clock()
+            node = rbt.get_ride(ride_num)
+            # The tree only changes when the update cancels the ride
+            if node is not None and new_duration > 2 * node.ride.triptime:
+                rbt.deleten(ride_num)
+                node = None
+            latencies.append(clock() - begin)
+            if node is not None:
+                # Track the new key for GetNextRide
+                ride = node.ride
+                if new_duration > ride.triptime:
+                    ride.cost_ride += 10
+                ride.triptime = new_duration
+                heapq.heappush(queue, (ride.cost_ride, ride.triptime, ride.ride_num, ride))
+        elif opcode == OP_REPRICE:
+            # The tree is keyed by ride_num and does not change; only the keys GetNextRide sees move
+            low, high, delta = args
+            for ride in (node.ride for node in rbt.iter_all_nodes()):
+                if low <= ride.cost_ride <= high:
+                    ride.cost_ride += delta
+                    heapq.heappush(queue, (ride.cost_ride, ride.triptime, ride.ride_num, ride))
+    return len(latencies), time.perf_counter() - start, latencies
+
+
+def replay_engine(workload_path, heap):
+    # Every command through GatorTaxi.submit one line at a time, parsing included, timed per command
+    with open(workload_path) as workload_file:
+        lines = workload_file.readlines()
+    engine = GatorTaxi(OutputSink(io.StringIO()), heap)
+    latencies = array("q")
+    clock = time.perf_counter_ns
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for line in lines:
+            begin = clock()
+            engine.submit(line)
+            latencies.append(clock() - begin)
+        elapsed = time.perf_counter() - start
+    return len(latencies), elapsed, latencies
+
+
+def replay_main(workload_path, output_path, heap, *options):
+    # The command line program itself, batching and buffered output included; no per-command timings
+    with open(workload_path) as workload_file:
+        count = sum(1 for line in workload_file if line.strip())
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        gator_taxi.main([workload_path, "--output", output_path, "--heap", heap, *options])
+        elapsed = time.perf_counter() - start
+    return count, elapsed, None
+
+
+def parse_input(workload_path, mapped):
+    # Only read and parse the commands, line by line or through ingest's memory-mapped tokenizer
+    start = time.perf_counter()
+    if mapped:
+        count = sum(1 for _ in ingest.iter_mapped_commands(workload_path))
+    else:
+        with open(workload_path) as workload_file:
+            count = sum(1 for _ in iter_commands(workload_file))
+    return count, time.perf_counter() - start, None
+
+
+def bench_ingest(size, seed, mix, distribution, range_width, update_split, heap):
+    """
+    Throughput and peak RSS of reading a workload line by line versus through the memory-mapped tokenizer,
+    for the parsing alone and for the whole gator_taxi.py run.
+    """
+    print(f"{'target':<12} {'commands':>9} {'kops/s':>9} {'peak RSS MB':>12}")
+    with tempfile.TemporaryDirectory() as directory:
+        workload_path = os.path.join(directory, "workload.txt")
+        output_path = os.path.join(directory, "output_file.txt")
+        run_isolated(write_workload, workload_path, size, seed, mix, distribution, range_width, update_split)
+
+        targets = [("parse", parse_input, (workload_path, False)),
+                   ("parse-mmap", parse_input, (workload_path, True)),
+                   ("main", replay_main, (workload_path, output_path, heap)),
+                   ("main-mmap", replay_main, (workload_path, output_path, heap, "--mmap"))]
+        for name, function, args in targets:
+            (count, elapsed, _), max_rss = run_isolated(function, *args)
+            print(f"{name:<12} {count:>9} {count / elapsed / 1000:>9.1f} {max_rss / 2 ** 20:>12.1f}")
+
+
+def isolated_call(connection, function, args):
+    # Child process body: run the function and send back its result and the peak RSS of the process
+    result = function(*args)
+    connection.send((result, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+    connection.close()
+
+
+def run_isolated(function, *args):
+    """
+    Run function(*args) in a fresh forked process, so that the reported peak RSS belongs to that run only.
+    Returns the function's result and the peak RSS in bytes.
+    """
+    context = multiprocessing.get_context("fork")
+    parent_end, child_end = context.Pipe(duplex=False)
+    process = context.Process(target=isolated_call, args=(child_end, function, args))
+    process.start()
+    child_end.close()
+    result, max_rss = parent_end.recv()
+    process.join()
+    # ru_maxrss is in kilobytes on Linux
+    return result, max_rss * 1024
+
+
+def percentile(ordered, fraction):
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def first_difference(first_path, second_path):
+    # Line number of the first differing line of two files, None if they are identical
+    with open(first_path) as first, open(second_path) as second:
+        line_number = 0
+        while True:
+            line_number += 1
+            first_line, second_line = first.readline(), second.readline()
+            if first_line != second_line:
+                return line_number
+            if not first_line:
+                return None
+
+
+# gator_taxi.py main() runs of the suite: target name -> extra command line options
+MAIN_VARIANTS = {
+    "main": (),
+    "main-mmap": ("--mmap",),
+    "main-blocks": ("--index", "blocks"),
+    "main-lazy": ("--lazy-cancel", "0.25"),
+    "main-cache": ("--range-cache", "64"),
+}
+
+
+def bench_suite(sizes, seed, mix, distribution, range_width, update_split, heap, check):
+    """
+    Generate a workload of each size and report throughput, p50/p99 latency per operation and peak RSS of
+    the heap backend, the RedBlackTree, GatorTaxi fed one line at a time and the gator_taxi.py main() run
+    with each of MAIN_VARIANTS.
+
+    With check, the output_file.txt written by every main() run is compared line by line with the
+    ReferenceDispatcher. Every target runs in its own process, the peak RSS includes the interpreter and the
+    parsed workload.
+    """
+    print(f"{'size':>9} {'target':<12} {'ops':>9} {'kops/s':>9} {'p50 us':>8} {'p99 us':>8} {'peak RSS MB':>12}")
+    with tempfile.TemporaryDirectory() as directory:
+        workload_path = os.path.join(directory, "workload.txt")
+        expected_path = os.path.join(directory, "expected.txt")
+        # Every main() run writes its own output file, so each of them can be checked
+        output_paths = {name: os.path.join(directory, f"{name}.txt") for name in MAIN_VARIANTS}
+
+        for size in sizes:
+            run_isolated(write_workload, workload_path, size, seed, mix, distribution, range_width, update_split)
+
+            targets = [(heap, replay_heap, (workload_path, heap)),
+                       ("rbt", replay_tree, (workload_path,)),
+                       ("engine", replay_engine, (workload_path, heap))]
+            targets.extend((name, replay_main, (workload_path, output_paths[name], heap, *options))
+                           for name, options in MAIN_VARIANTS.items())
+            for name, function, args in targets:
+                (count, elapsed, latencies), max_rss = run_isolated(function, *args)
+                if latencies:
+                    ordered = sorted(latencies)
+                    p50 = f"{percentile(ordered, 0.50) / 1000:.2f}"
+                    p99 = f"{percentile(ordered, 0.99) / 1000:.2f}"
+                else:
+                    p50 = p99 = "-"
+                print(f"{size:>9} {name:<12} {count:>9} {count / elapsed / 1000:>9.1f} {p50:>8} {p99:>8} "
+                      f"{max_rss / 2 ** 20:>12.1f}")
+
+            if check:
+                run_isolated(reference_output, workload_path, expected_path)
+                for name, output_path in output_paths.items():
+                    line_number = first_difference(output_path, expected_path)
+                    if line_number is not None:
+                        raise SystemExit(f"output_file.txt of {name} differs from the reference at line {line_number}")
+                    print(f"{size:>9} {'check':<12} output_file.txt of {name} matches the reference")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the GatorTaxi data structures")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    removal = subparsers.add_parser("heap-removal", help="per-operation cost of pop/delete_element vs heap size")
+    removal.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 500000])
+    removal.add_argument("--ops", type=int, default=1000, help="removals timed per heap size")
+    removal.add_argument("--seed", type=int, default=1)
+
+    heap_ops = subparsers.add_parser("heap-ops", help="insert/pop/update micro-benchmark vs heap size")
+    heap_ops.add_argument("--sizes", type=int, nargs="+", default=[10 ** 4, 10 ** 5, 10 ** 6],
+                          help="heap sizes, up to 10^7 (default: 10^4 10^5 10^6)")
+    heap_ops.add_argument("--ops", type=int, default=10000, help="operations timed per heap size")
+    heap_ops.add_argument("--seed", type=int, default=1)
+
+    backends = subparsers.add_parser("heap-backends", help="pick the fastest heap backend for a command mix")
+    backends.add_argument("--size", type=int, default=200000, help="number of commands")
+    backends.add_argument("--inserts", type=float, default=4, help="relative weight of Insert")
+    backends.add_argument("--updates", type=float, default=4, help="relative weight of UpdateTrip")
+    backends.add_argument("--cancels", type=float, default=1, help="relative weight of CancelRide")
+    backends.add_argument("--next-rides", type=float, default=1, help="relative weight of GetNextRide")
+    backends.add_argument("--seed", type=int, default=1)
+
+    wal = subparsers.add_parser("wal", help="per-command overhead of the write-ahead log")
+    wal.add_argument("--size", type=int, default=200000, help="number of commands")
+    wal.add_argument("--sync-every", type=int, default=1024, help="group commit size")
+    wal.add_argument("--seed", type=int, default=1)
+
+    lazy_cancel = subparsers.add_parser("lazy-cancel", help="eager CancelRide vs tombstones in the heap")
+    lazy_cancel.add_argument("--size", type=int, default=200000, help="number of commands")
+    lazy_cancel.add_argument("--cancels", type=float, default=4,
+                             help="relative weight of CancelRide, against 4 Insert, 2 UpdateTrip and 1 GetNextRide")
+    lazy_cancel.add_argument("--fractions", type=float, nargs="+", default=[0.1, 0.25, 0.5],
+                             help="dead fractions that trigger a compaction")
+    lazy_cancel.add_argument("--seed", type=int, default=1)
+
+    index = subparsers.add_parser("index", help="red-black tree vs sorted blocks: lookups, wide Prints, updates")
+    index.add_argument("--size", type=int, default=10 ** 6, help="rides in the dispatcher")
+    index.add_argument("--lookups", type=int, default=100000, help="point lookups and cancels timed")
+    index.add_argument("--widths", type=int, nargs="+", default=[100, 10000, 1000000],
+                       help="ride_num widths of the Print(low, high) ranges")
+    index.add_argument("--seed", type=int, default=1)
+
+    range_cache = subparsers.add_parser("range-cache", help="repeated Print(low, high) windows with and without "
+                                                            "the RangeCache")
+    range_cache.add_argument("--size", type=int, default=200000, help="rides in the dispatcher")
+    range_cache.add_argument("--windows", type=int, default=8, help="distinct Print(low, high) windows")
+    range_cache.add_argument("--width", type=int, default=200, help="ride_nums covered by a window")
+    range_cache.add_argument("--prints-per-change", type=int, default=20,
+                             help="Prints between two UpdateTrip/CancelRide commands")
+    range_cache.add_argument("--capacities", type=int, nargs="+", default=[4, 8, 64], help="cache sizes")
+    range_cache.add_argument("--seed", type=int, default=1)
+
+    update_batch = subparsers.add_parser("update-batch", help="UpdateTrip bursts one by one vs update_many")
+    update_batch.add_argument("--size", type=int, default=200000, help="rides in the dispatcher")
+    update_batch.add_argument("--batches", type=int, nargs="+", default=[1000, 10000, 50000, 200000],
+                              help="updates per burst")
+    update_batch.add_argument("--seed", type=int, default=1)
+
+    memory = subparsers.add_parser("memory", help="bytes held per ride by the node layouts")
+    memory.add_argument("--size", type=int, default=200000)
+
+    workload_options = argparse.ArgumentParser(add_help=False)
+    workload_options.add_argument("--seed", type=int, default=1)
+    workload_options.add_argument("--mix", type=parse_mix_option, default=DEFAULT_MIX,
+                                  help=f"relative weight of each operation (default: {DEFAULT_MIX})")
+    workload_options.add_argument("--distribution", choices=KEY_DISTRIBUTIONS, default="uniform",
+                                  help="how ride_nums are chosen (default: uniform)")
+    workload_options.add_argument("--range-width", type=int, default=100, help="ride_nums covered by Print(low, high)")
+    workload_options.add_argument("--update-split", type=lambda text: tuple(float(v) for v in text.split(",")),
+                                  default=(60, 30, 10), metavar="SHORTER,LONGER,CANCEL",
+                                  help="relative weights of the UpdateTrip outcomes (default: 60,30,10)")
+
+    workload = subparsers.add_parser("workload", parents=[workload_options],
+                                     help="write a synthetic command file in the input syntax")
+    workload.add_argument("output", help="path of the command file")
+    workload.add_argument("--size", type=int, default=100000, help="number of commands")
+
+    ingest_parser = subparsers.add_parser("ingest", parents=[workload_options],
+                                          help="line by line versus memory-mapped reading of a command file")
+    ingest_parser.add_argument("--size", type=int, default=10 ** 6, help="number of commands")
+    ingest_parser.add_argument("--heap", choices=sorted(HEAP_BACKENDS), default="binary")
+
+    suite = subparsers.add_parser("suite", parents=[workload_options],
+                                  help="throughput, latency and peak RSS of heap, tree and dispatcher on a workload")
+    suite.add_argument("--sizes", type=int, nargs="+", default=[10 ** 3, 10 ** 4, 10 ** 5],
+                       help="workload sizes, 10^3 to 10^7 (default: 10^3 10^4 10^5)")
+    suite.add_argument("--heap", choices=sorted(HEAP_BACKENDS), default="binary")
+    suite.add_argument("--check", action="store_true",
+                       help="compare the output of main() with the reference dispatcher")
+
+    args = parser.parse_args()
+    if args.benchmark == "heap-removal":
+        bench_heap_removal(args.sizes, args.ops, args.seed)
+    elif args.benchmark == "heap-ops":
+        bench_heap_ops(args.sizes, args.ops, args.seed)
+    elif args.benchmark == "heap-backends":
+        bench_heap_backends(args.size, args.inserts, args.updates, args.cancels, args.next_rides, args.seed)
+    elif args.benchmark == "wal":
+        bench_wal(args.size, args.sync_every, args.seed)
+    elif args.benchmark == "lazy-cancel":
+        bench_lazy_cancel(args.size, args.cancels, args.fractions, args.seed)
+    elif args.benchmark == "index":
+        bench_index(args.size, args.lookups, args.widths, args.seed)
+    elif args.benchmark == "range-cache":
+        bench_range_cache(args.size, args.windows, args.width, args.prints_per_change, args.capacities, args.seed)
+    elif args.benchmark == "update-batch":
+        bench_update_batch(args.size, args.batches, args.seed)
+    elif args.benchmark == "memory":
+        bench_memory(args.size)
+    elif args.benchmark == "workload":
+        write_workload(args.output, args.size, args.seed, args.mix, args.distribution, args.range_width,
+                       args.update_split)
+    elif args.benchmark == "ingest":
+        bench_ingest(args.size, args.seed, args.mix, args.distribution, args.range_width, args.update_split,
+                     args.heap)
+    elif args.benchmark == "suite":
+        bench_suite(args.sizes, args.seed, args.mix, args.distribution, args.range_width, args.update_split,
+                    args.heap, args.check)
+
+
+if __name__ == "__main__":
+    main()
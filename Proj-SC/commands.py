@@ -0,0 +1,83 @@
+# The command language of the dispatcher, shared by gator_taxi, ingest and metrics. It lives in its own module so
+# that the tools importing it never load a second copy of gator_taxi when gator_taxi.py runs as a script.
+
+# Opcodes of the commands understood by the dispatcher
+OP_INSERT = 0
+OP_PRINT = 1
+OP_PRINT_RANGE = 2
+OP_UPDATE_TRIP = 3
+OP_GET_NEXT_RIDE = 4
+OP_CANCEL_RIDE = 5
+OP_COUNT_RIDES = 6
+OP_PEEK_NEXT_RIDE = 7
+OP_TOP_RIDES = 8
+OP_GET_NEXT_RIDES = 9
+OP_PRINT_BY_COST = 10
+OP_REPRICE = 11
+
+# Command name -> {number of arguments: opcode}
+COMMANDS = {
+    "Insert": {3: OP_INSERT},
+    "Print": {1: OP_PRINT, 2: OP_PRINT_RANGE},
+    "UpdateTrip": {2: OP_UPDATE_TRIP},
+    "GetNextRide": {0: OP_GET_NEXT_RIDE},
+    "GetNextRides": {1: OP_GET_NEXT_RIDES},
+    "CancelRide": {1: OP_CANCEL_RIDE},
+    "CountRides": {2: OP_COUNT_RIDES},
+    "PeekNextRide": {0: OP_PEEK_NEXT_RIDE},
+    "TopRides": {1: OP_TOP_RIDES},
+    "PrintByCost": {2: OP_PRINT_BY_COST},
+    "Reprice": {3: OP_REPRICE},
+}
+
+# Opcode -> command name, used for sizing the dispatch table and for reporting
+OPCODE_NAMES = {opcode: name for name, arities in COMMANDS.items() for opcode in arities.values()}
+
+# Largest count accepted by GetNextRides. Every missing ride is answered with a line, so a larger count would only
+# make the dispatcher write lines for a very long time
+MAX_GET_NEXT_RIDES = 10 ** 8
+
+
+def parse_command(line):
+    """
+    Parse a single command line such as "Insert(5,50,120)" into an (opcode, args) tuple.
+
+    Returns None for blank lines and raises ValueError for anything that is not a known command, or for a
+    GetNextRides count that is not between 1 and MAX_GET_NEXT_RIDES.
+    """
+    open_ind = line.find("(")
+    if open_ind == -1:
+        if line.strip() == "":
+            return None
+        raise ValueError(f"Malformed command: {line.strip()}")
+
+    close_ind = line.find(")", open_ind)
+    if close_ind == -1:
+        raise ValueError(f"Malformed command: {line.strip()}")
+
+    # The command is identified by its exact name and argument count, not by substring matching
+    name = line[:open_ind].strip()
+    args = tuple(int(num) for num in line[open_ind + 1:close_ind].split(",") if num.strip() != "")
+    opcode = COMMANDS.get(name, {}).get(len(args))
+    if opcode is None:
+        raise ValueError(f"Unknown command: {line.strip()}")
+    if opcode == OP_GET_NEXT_RIDES and not 1 <= args[0] <= MAX_GET_NEXT_RIDES:
+        raise ValueError(f"GetNextRides count must be between 1 and {MAX_GET_NEXT_RIDES}: {line.strip()}")
+    return opcode, args
+
+
+def iter_commands(lines):
+    """
+    Lazily parse any iterable of lines (an open file, sys.stdin, a generator, ...) into (opcode, args) tuples.
+    Only one line is held in memory at a time.
+    """
+    for line in lines:
+        command = parse_command(line)
+        if command is not None:
+            yield command
+
+
+# Runs of consecutive Insert commands at least this long are loaded through bulk_insert
+BULK_INSERT_MIN_RUN = 64
+# GatorTaxi.update_many applies batches at least this long through update_rides
+BULK_UPDATE_MIN_RUN = 64
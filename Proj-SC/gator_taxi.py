@@ -1,4 +1,25 @@
+import argparse
+import bisect
+import gc
+import heapq
+import itertools
+import os
 import sys
+from collections import OrderedDict
+
+import persistence
+from commands import (BULK_INSERT_MIN_RUN, BULK_UPDATE_MIN_RUN, COMMANDS, OP_CANCEL_RIDE, OP_COUNT_RIDES,
+                      OP_GET_NEXT_RIDE, OP_GET_NEXT_RIDES, OP_INSERT, OP_PEEK_NEXT_RIDE, OP_PRINT, OP_PRINT_BY_COST,
+                      OP_PRINT_RANGE, OP_REPRICE, OP_TOP_RIDES, OP_UPDATE_TRIP, OPCODE_NAMES, iter_commands,
+                      parse_command)
+
+# MinHeap.reprice_many re-heapifies once the repriced rides are at least 1/ratio of the heap
+BULK_REPRICE_RATIO = 8
+# MinHeap.rekey_many does the same once the rekeyed and removed rides are at least 1/ratio of the heap. Keys that
+# move independently of each other (unlike the shifted band of reprice_many) sift only a few levels each, so one
+# heapify pass only pays off for a larger share of the heap
+BULK_REKEY_RATIO = 4
+
 
 class MinHeap:
     def __init__(self):
@@ -15,6 +36,117 @@ class MinHeap:
         # Move the new element up the heap until it is in the correct position
         self.bubble_up(self.curr_size)
 
+    def heapify(self, nodes):
+        # Add a batch of MinHeapNodes and rebuild the heap bottom-up in O(n) instead of n separate inserts
+        for node in nodes:
+            self.heap_list.append(node)
+            self.curr_size += 1
+            node.min_heap_index = self.curr_size
+
+        # Sift down every internal node, starting from the last one
+        for p in range(self.parent(self.curr_size), 0, -1):
+            self.bubble_down(p)
+
+    def new_node(self, ride):
+        # Create the MinHeapNode for a ride that is about to be inserted at the end of the heap
+        return MinHeapNode(ride, None, self.curr_size + 1)
+
+    def parent(self, p):
+        # Index of the parent of the element at index p
+        return p // 2
+
+    def children(self, p):
+        # Indices of the children of the element at index p
+        return range(2 * p, min(2 * p + 1, self.curr_size) + 1)
+
+    def peek(self):
+        # The MinHeapNode of the cheapest ride without removing it, None if the heap is empty
+        if self.curr_size == 0:
+            return None
+        return self.heap_list[1]
+
+    def top_k(self, k):
+        """
+        Return the MinHeapNodes of the k cheapest rides in ascending order of key, without changing the heap.
+
+        Best-first search from the root: the next cheapest ride is always the smallest entry of a frontier of
+        candidates, and only its children become new candidates, so this is O(k log k) whatever the heap size.
+        """
+        heap_list = self.heap_list
+        result = []
+        if k <= 0 or self.curr_size == 0:
+            return result
+
+        # (key, index) entries; the index breaks ties between equal keys
+        frontier = [(heap_list[1].key, 1)]
+        while frontier and len(result) < k:
+            _, p = heapq.heappop(frontier)
+            result.append(heap_list[p])
+            for child in self.children(p):
+                heapq.heappush(frontier, (heap_list[child].key, child))
+        return result
+
+    # The operations below take the MinHeapNode itself, so callers do not depend on how a backend locates it
+
+    def update_node(self, node, new_key):
+        self.update_element(node.min_heap_index, new_key)
+
+    def reprice_node(self, node, new_cost, new_triptime):
+        self.reprice_element(node.min_heap_index, new_cost, new_triptime)
+
+    def delete_node(self, node):
+        self.delete_element(node.min_heap_index)
+
+    def reprice_many(self, nodes, delta):
+        """
+        Add delta to the cost of the ride of every given MinHeapNode.
+
+        A few nodes are re-sifted one at a time. Once they are at least 1/BULK_REPRICE_RATIO of the heap, all of
+        the keys are changed first and the heap order is restored by one bottom-up heapify pass, O(n).
+        """
+        if len(nodes) * BULK_REPRICE_RATIO < self.curr_size:
+            for node in nodes:
+                self.reprice_node(node, node.ride.cost_ride + delta, node.ride.triptime)
+            return
+
+        for node in nodes:
+            node.ride.cost_ride += delta
+            node.key = (node.ride.cost_ride, node.ride.triptime)
+        self.heapify([])
+
+    def rekey_many(self, updates, removals):
+        """
+        Give every (node, cost, triptime) of updates its new key and remove every node of removals.
+
+        As in reprice_many, a small batch is applied one node at a time, and a batch of at least
+        1/BULK_REKEY_RATIO of the heap changes all of the keys in place, drops the removed nodes from the
+        array and restores the heap order with one heapify pass.
+        """
+        if (len(updates) + len(removals)) * BULK_REKEY_RATIO < self.curr_size:
+            # reprice_element, inlined
+            for node, cost, triptime in updates:
+                ride = node.ride
+                ride.cost_ride = cost
+                ride.triptime = triptime
+                node.key = (cost, triptime)
+                self.resift(node.min_heap_index)
+            for node in removals:
+                self.delete_element(node.min_heap_index)
+            return
+
+        for node, cost, triptime in updates:
+            node.ride.cost_ride = cost
+            node.ride.triptime = triptime
+            node.key = (cost, triptime)
+        if removals:
+            removed = set(removals)
+            kept = [node for node in self.heap_list[1:] if node not in removed]
+            self.heap_list = [0]
+            self.curr_size = 0
+            self.heapify(kept)
+        else:
+            self.heapify([])
+
     def swap(self, ind1, ind2):
         # Store the element at ind1 in a temporary variable
         temp = self.heap_list[ind1]
@@ -36,7 +168,7 @@ class MinHeap:
         else:
             # Compare the left and right child elements and return the index
             # of the minimum one
-            if self.heap_list[p * 2].ride.less_than(self.heap_list[(p * 2) + 1].ride):
+            if self.heap_list[p * 2].key <= self.heap_list[(p * 2) + 1].key:
                 return p * 2
             else:
                 return (p * 2) + 1
@@ -45,14 +177,26 @@ class MinHeap:
         # Get the node at index p
         node = self.heap_list[p]
 
-        # Update the key of the ride associated with the node
+        # Update the key of the ride associated with the node, and the cached priority key with it
         node.ride.triptime = new_key
+        node.key = (node.ride.cost_ride, new_key)
+        self.resift(p)
 
+    def reprice_element(self, p, new_cost, new_triptime):
+        # Change both the cost and the trip duration of the ride at index p in place
+        node = self.heap_list[p]
+        node.ride.cost_ride = new_cost
+        node.ride.triptime = new_triptime
+        node.key = (new_cost, new_triptime)
+        self.resift(p)
+
+    def resift(self, p):
+        # Restore the heap order around index p after the key of its ride changed
         # If the node is the root of the heap, bubble down
         if p == 1:
             self.bubble_down(p)
         # If the node's parent has a smaller ride, bubble down
-        elif self.heap_list[p // 2].ride.less_than(self.heap_list[p].ride):
+        elif self.heap_list[self.parent(p)].key <= self.heap_list[p].key:
             self.bubble_down(p)
         # Otherwise, bubble up
         else:
@@ -65,17 +209,27 @@ class MinHeap:
         # Decrement the size of the heap
         self.curr_size -= 1
 
-        # Delete the last element from the heap list using tuple unpacking
-        *self.heap_list, _ = self.heap_list
+        # Drop the last element in place (O(1), the list is not copied)
+        self.heap_list.pop()
 
-        # Move the swapped element down the heap until it is in the correct position
-        self.bubble_down(p)
+        # If the deleted element was the last one, nothing was moved
+        if p > self.curr_size:
+            return
+
+        # The element moved into p may belong above or below it
+        if p > 1 and self.heap_list[p].key <= self.heap_list[self.parent(p)].key:
+            self.bubble_up(p)
+        else:
+            self.bubble_down(p)
 
     def bubble_up(self, p):
+        heap_list = self.heap_list
+        # The same element moves all the way up, so its key is read once
+        key = heap_list[p].key
         # While the parent of the current node is valid (i.e., not the root)
         while (p // 2) > 0:
             # If the current node is less than its parent, swap them
-            if self.heap_list[p].ride.less_than(self.heap_list[p // 2].ride):
+            if key <= heap_list[p // 2].key:
                 self.swap(p, (p // 2))
             # Otherwise, break out of the loop
             else:
@@ -84,21 +238,33 @@ class MinHeap:
             p = p // 2
 
     def bubble_down(self, p):
+        heap_list = self.heap_list
+        size = self.curr_size
+        # Nothing to do for a leaf (or for an index past the end, e.g. after popping the last element)
+        if (p * 2) > size:
+            return
+        # The same element moves all the way down, so its key is read once
+        key = heap_list[p].key
         # While the left child of the current node is valid (i.e., not out of range)
-        while (p * 2) <= self.curr_size:
-            # Get the index of the child with the minimum ride
-            ind = self.get_minchild(p)
-
-            # If the current node is greater than its minimum child, swap them
-            if not self.heap_list[p].ride.less_than(self.heap_list[ind].ride):
+        while (p * 2) <= size:
+            # Get the index of the child with the minimum ride (get_minchild, inlined for the hot loop)
+            ind = p * 2
+            if ind + 1 <= size and not heap_list[ind].key <= heap_list[ind + 1].key:
+                ind += 1
+
+            # If the current node is greater than its minimum child, swap them,
+            # otherwise it is in place (the subtrees below are already heaps)
+            if not key <= heap_list[ind].key:
                 self.swap(p, ind)
+            else:
+                break
 
             # Move down to the minimum child node
             p = ind
 
     def pop(self):
         # Check if there are any rides available in the heap
-        if len(self.heap_list) == 1:
+        if self.curr_size == 0:
             return 'No Rides Available'
 
         # Get the root node (i.e., the ride with the minimum trip duration)
@@ -108,8 +274,8 @@ class MinHeap:
         self.swap(1, self.curr_size)
         self.curr_size -= 1
 
-        # Delete the last element from the heap list using tuple unpacking
-        *self.heap_list, _ = self.heap_list
+        # Drop the last element in place (O(1), the list is not copied)
+        self.heap_list.pop()
 
         # Move the swapped element down the heap until it is in the correct position
         self.bubble_down(1)
@@ -118,7 +284,11 @@ class MinHeap:
         return root
 
 
+
 class MinHeapNode:
+    # Fixed attribute slots instead of a per-instance __dict__, one of these exists per active ride
+    __slots__ = ("ride", "rbt_node", "min_heap_index", "key")
+
     def __init__(self, ride, rbt_node, min_heap_index):
         """
         Initialize a MinHeapNode object.
@@ -132,71 +302,560 @@ class MinHeapNode:
         self.rbt_node = rbt_node
         self.min_heap_index = min_heap_index
 
+        # Cached priority key. (cost, triptime) tuples compare with <= exactly like Ride.less_than,
+        # so the heap compares keys directly instead of calling less_than; kept in sync by the heap
+        self.key = (ride.cost_ride, ride.triptime)
+
+
+
+class DaryHeap(MinHeap):
+    """
+    Array heap where every element has d children (4 by default) instead of 2.
+
+    The tree is half as deep as the binary heap, so bubble_up and bubble_down do fewer swaps and the
+    children compared at each level sit next to each other in heap_list. The array layout, the 1-based
+    indexing and min_heap_index are the same as in MinHeap.
+    """
+
+    def __init__(self, d=4):
+        super().__init__()
+        self.d = d
+
+    def parent(self, p):
+        return (p - 2) // self.d + 1
+
+    def children(self, p):
+        first = self.d * (p - 1) + 2
+        return range(first, min(first + self.d - 1, self.curr_size) + 1)
+
+    def get_minchild(self, p):
+        # The children of p are at indices d*(p-1)+2 ... d*p+1; return the first one holding the minimum ride
+        heap_list = self.heap_list
+        first = self.d * (p - 1) + 2
+        last = min(first + self.d - 1, self.curr_size)
+        ind = first
+        for child in range(first + 1, last + 1):
+            if not heap_list[ind].key <= heap_list[child].key:
+                ind = child
+        return ind
+
+    def bubble_up(self, p):
+        heap_list = self.heap_list
+        d = self.d
+        key = heap_list[p].key
+        while p > 1:
+            # If the current node is less than its parent, swap them
+            parent = (p - 2) // d + 1
+            if key <= heap_list[parent].key:
+                self.swap(p, parent)
+            else:
+                break
+            p = parent
+
+    def bubble_down(self, p):
+        heap_list = self.heap_list
+        d = self.d
+        size = self.curr_size
+        if d * (p - 1) + 2 > size:
+            return
+        key = heap_list[p].key
+        # While the first child of the current node is valid
+        while d * (p - 1) + 2 <= size:
+            ind = self.get_minchild(p)
+            # Swap with the minimum child unless the current node is already in place
+            if not key <= heap_list[ind].key:
+                self.swap(p, ind)
+            else:
+                break
+            p = ind
+
+
+class PairingHeapNode(MinHeapNode):
+    # child: leftmost child, sibling: next sibling to the right,
+    # prev: the left sibling, or the parent for a leftmost child
+    __slots__ = ("child", "sibling", "prev")
+
+    def __init__(self, ride, rbt_node, min_heap_index):
+        super().__init__(ride, rbt_node, min_heap_index)
+        self.child = None
+        self.sibling = None
+        self.prev = None
+
+
+class PairingHeap:
+    """
+    Pairing heap with the same node-based contract as MinHeap (insert, pop, heapify, update_node,
+    reprice_node, delete_node, curr_size).
+
+    insert and decrease-key are O(1) and pop/delete are O(log n) amortized, which suits UpdateTrip heavy
+    workloads where most updates shorten a trip. The nodes are linked to each other, min_heap_index is unused.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.curr_size = 0
+
+    def new_node(self, ride):
+        return PairingHeapNode(ride, None, 0)
+
+    def peek(self):
+        # The node of the cheapest ride without removing it, None if the heap is empty
+        return self.root
+
+    def top_k(self, k):
+        # Same best-first search as MinHeap.top_k, over the child lists instead of array indices
+        result = []
+        if k <= 0 or self.root is None:
+            return result
+
+        # (key, sequence number, node) entries; the sequence number breaks ties so nodes are never compared
+        sequence = 0
+        frontier = [(self.root.key, sequence, self.root)]
+        while frontier and len(result) < k:
+            node = heapq.heappop(frontier)[2]
+            result.append(node)
+            child = node.child
+            while child is not None:
+                sequence += 1
+                heapq.heappush(frontier, (child.key, sequence, child))
+                child = child.sibling
+        return result
+
+    def meld(self, first, second):
+        # Make the root with the larger key the leftmost child of the other one and return the new root
+        if first is None:
+            return second
+        if second is None:
+            return first
+        if not first.key <= second.key:
+            first, second = second, first
+        second.prev = first
+        second.sibling = first.child
+        if first.child is not None:
+            first.child.prev = second
+        first.child = second
+        first.sibling = None
+        return first
+
+    def merge_pairs(self, first):
+        # Two-pass pairing of a sibling list: meld neighbours left to right, then fold the pairs right to left
+        pairs = []
+        while first is not None:
+            second = first.sibling
+            if second is None:
+                first.prev = None
+                pairs.append(first)
+                break
+            rest = second.sibling
+            first.prev = first.sibling = None
+            second.prev = second.sibling = None
+            pairs.append(self.meld(first, second))
+            first = rest
+
+        root = None
+        for tree in reversed(pairs):
+            root = self.meld(tree, root)
+        return root
+
+    def cut(self, node):
+        # Detach the subtree rooted at node from its parent and siblings
+        if node.prev.child is node:
+            node.prev.child = node.sibling
+        else:
+            node.prev.sibling = node.sibling
+        if node.sibling is not None:
+            node.sibling.prev = node.prev
+        node.prev = None
+        node.sibling = None
+
+    def insert(self, ele):
+        ele.child = ele.sibling = ele.prev = None
+        self.root = self.meld(self.root, ele)
+        self.curr_size += 1
+
+    def heapify(self, nodes):
+        # Inserting is O(1), so a batch of n nodes is added in O(n)
+        for node in nodes:
+            self.insert(node)
+
+    def pop(self):
+        # Check if there are any rides available in the heap
+        if self.curr_size == 0:
+            return 'No Rides Available'
+
+        root = self.root
+        self.root = self.merge_pairs(root.child)
+        root.child = None
+        self.curr_size -= 1
+        return root
+
+    def delete_node(self, node):
+        if node is self.root:
+            self.pop()
+            return
+        # Cut the node out, pair up its children and meld them back under the root
+        self.cut(node)
+        subtree = self.merge_pairs(node.child)
+        node.child = None
+        self.root = self.meld(self.root, subtree)
+        self.curr_size -= 1
+
+    def rekey(self, node, new_key):
+        old_key = node.key
+        node.key = new_key
+        if node is self.root:
+            # Only the root can move down: re-insert it if its key grew
+            if old_key < new_key and node.child is not None:
+                self.pop()
+                self.insert(node)
+        elif new_key <= old_key:
+            # Decrease-key: cut the subtree and meld it with the root, O(1)
+            self.cut(node)
+            self.root = self.meld(self.root, node)
+        else:
+            # Increase-key: the children may now be smaller, so remove and re-insert the node
+            self.delete_node(node)
+            self.insert(node)
+
+    def update_node(self, node, new_key):
+        node.ride.triptime = new_key
+        self.rekey(node, (node.ride.cost_ride, new_key))
+
+    def reprice_node(self, node, new_cost, new_triptime):
+        node.ride.cost_ride = new_cost
+        node.ride.triptime = new_triptime
+        self.rekey(node, (new_cost, new_triptime))
+
+    def reprice_many(self, nodes, delta):
+        # Decrease-key is O(1) here, an increase is a cut and re-insert
+        for node in nodes:
+            self.reprice_node(node, node.ride.cost_ride + delta, node.ride.triptime)
+
+    def rekey_many(self, updates, removals):
+        # Every change is already cheap on its own, there is no array to rebuild
+        for node, cost, triptime in updates:
+            self.reprice_node(node, cost, triptime)
+        for node in removals:
+            self.delete_node(node)
+
+
+# Priority queue backends selectable by name
+HEAP_BACKENDS = {
+    "binary": MinHeap,
+    "4-ary": DaryHeap,
+    "pairing": PairingHeap,
+}
+
+
+class LazyDeleteHeap:
+    """
+    Wraps any heap backend so that delete_node only marks the node dead (a tombstone) instead of removing it.
+
+    Most cancelled rides would never have reached the top of the heap, so most tombstones are never touched
+    again: pop, peek and top_k skip or drop the dead nodes they meet at the top, and once the dead nodes are
+    more than max_dead_fraction of the wrapped heap they are all removed by one rekey_many, which the array
+    heaps do with a single heapify pass. curr_size counts the live rides only, so callers see the same heap
+    as without tombstones.
+    """
+
+    def __init__(self, inner, max_dead_fraction=0.25):
+        self.inner = inner
+        self.max_dead_fraction = max_dead_fraction
+        # The MinHeapNodes of cancelled rides that are still in the wrapped heap
+        self.dead = set()
+        # Operations that never meet a dead node go straight to the wrapped heap, with no extra call
+        self.insert = inner.insert
+        self.heapify = inner.heapify
+        self.new_node = inner.new_node
+        self.update_node = inner.update_node
+        self.reprice_node = inner.reprice_node
+        self.reprice_many = inner.reprice_many
+
+    @property
+    def curr_size(self):
+        return self.inner.curr_size - len(self.dead)
+
+    def drop_dead_top(self):
+        # Remove the dead nodes sitting at the top, so the top of the wrapped heap is a live ride
+        inner, dead = self.inner, self.dead
+        while dead and inner.curr_size and inner.peek() in dead:
+            dead.discard(inner.pop())
+
+    def pop(self):
+        # Pop until a live node comes out; an empty heap's message is never dead
+        inner, dead = self.inner, self.dead
+        node = inner.pop()
+        while node in dead:
+            dead.discard(node)
+            node = inner.pop()
+        return node
+
+    def peek(self):
+        self.drop_dead_top()
+        return self.inner.peek()
+
+    def top_k(self, k):
+        # Ask the wrapped heap for more nodes until k of them are live, or there are no more
+        self.drop_dead_top()
+        want = k
+        while True:
+            nodes = [node for node in self.inner.top_k(want) if node not in self.dead]
+            if len(nodes) >= k or want >= self.inner.curr_size:
+                return nodes[:k]
+            want *= 2
+
+    def rekey_many(self, updates, removals):
+        self.inner.rekey_many(updates, [])
+        for node in removals:
+            self.delete_node(node)
+
+    def delete_node(self, node):
+        self.dead.add(node)
+        if len(self.dead) > self.max_dead_fraction * self.inner.curr_size:
+            self.compact()
+
+    def compact(self):
+        # Remove every dead node from the wrapped heap at once
+        self.inner.rekey_many([], list(self.dead))
+        self.dead.clear()
+
+
+
+# OrderedIndex.delete_many rebuilds the index when the batch is at least 1/ratio of the index
+BATCH_DELETE_REBUILD_RATIO = 8
 
 
 class RBTNode:
-    def __init__(self, ride, min_heap_node):
+    __slots__ = ("ride", "pp", "left", "right", "color", "min_heap_node", "size", "key")
+
+    def __init__(self, ride, min_heap_node, key=None):
         """
         Create a new RBTNode object.
 
         Arguments:
         - ride: a Ride object to be stored in this node
         - min_heap_node: the MinHeapNode object associated with the ride
+        - key: the value the tree orders its nodes by, the ride_num of the ride by default
         """
         self.ride = ride
+        self.key = ride.ride_num if key is None and ride is not None else key
         self.pp = None  # initialize pp node to None
         self.left = None  # initialize left node to None
         self.right = None  # initialize right node to None
         self.color = 1  # initialize color to red (1) by default
         self.min_heap_node = min_heap_node
+        self.size = 1  # number of nodes in the subtree rooted here, for the order statistics
+
 
 
+class OrderedIndex:
+    """
+    The queries and updates of an ordered index of the rides that do not depend on how the rides are stored,
+    shared by RedBlackTree and SortedBlockIndex.
+
+    A backend only provides the storage primitives: get_ride, iter_nodes, iter_all_nodes, count_below, select,
+    insert, insert_if_absent, deleten, build, new_node and __len__ (the number of rides).
+    """
 
-class RedBlackTree:
     def __init__(self):
+        # Optional CostIndex over the same rides, built on first use (see cost_index)
+        self.cost_index = None
+        # Optional RangeCache of the Print(low, high) results, see GatorTaxi
+        self.range_cache = None
+
+    def ride_key(self, ride):
+        # The key this index orders a ride by
+        return ride.ride_num
+
+    def iter_range(self, low, high, limit=None, cursor=None):
+        """
+        Lazily yield the rides with low <= ride_num <= high in ascending order of ride_num.
+        See iter_nodes for limit and cursor.
+        """
+        for node in self.iter_nodes(low, high, limit, cursor):
+            yield node.ride
+
+    def getrange(self, low, high):
+        # Return the list of rides falling within the range [low, high]
+        return list(self.iter_range(low, high))
+
+    def page_range(self, low, high, limit, cursor=None):
+        """
+        Return one page of at most limit rides in [low, high] together with the cursor for the next page.
+        The cursor is None once the range is exhausted; pass it back unchanged to fetch the following page.
+        """
+        rides = list(self.iter_range(low, high, limit, cursor))
+        next_cursor = rides[-1].ride_num if len(rides) == limit else None
+        return rides, next_cursor
+
+    def rank(self, ride_num):
+        # Number of rides with ride_num <= the given one, i.e. the 1-based position of an existing ride
+        return self.count_below(ride_num, True)
+
+    def count_range(self, low, high):
+        # Number of rides with low <= ride_num <= high from two count_below calls, without visiting them
+        if low > high:
+            return 0
+        return self.count_below(high, True) - self.count_below(low)
+
+    def upsert(self, ride, min_heap):
+        """
+        Insert the ride, or replace the ride and heap node stored under its ride_num in place.
+
+        Returns a tuple (node, inserted) where inserted is False if the ride_num already existed.
+        """
+        node, inserted = self.insert_if_absent(ride, min_heap)
+        if not inserted:
+            node.ride = ride
+            node.min_heap_node = min_heap
+        return node, inserted
+
+    def delete_many(self, ride_nums):
+        """
+        Delete a batch of ride_nums that are all in the index.
+
+        A small batch is deleted one ride at a time. Once the batch is at least 1/BATCH_DELETE_REBUILD_RATIO of
+        the index, the surviving nodes are linked again with build instead: one O(n) pass over the index, which
+        is cheaper than that many single deletions (for the tree, O(log n) each with their fix-ups).
+        """
+        if len(ride_nums) * BATCH_DELETE_REBUILD_RATIO < len(self):
+            for ride_num in ride_nums:
+                self.deleten(ride_num)
+            return
+
+        removed = set(ride_nums)
+        self.build([node for node in self.iter_all_nodes() if node.key not in removed])
+
+
+class RedBlackTree(OrderedIndex):
+    def __init__(self):
+        super().__init__()
         self.null_node = RBTNode(None, None)
         self.null_node.left = None
         self.null_node.right = None
         self.null_node.color = 0
+        self.null_node.size = 0
         self.root = self.null_node
+        # Hash index key -> RBTNode kept in step with the tree, so point lookups and deletes find their node
+        # in O(1) and the tree is only walked for ordered queries and relinked for structural changes
+        self.nodes = {}
+
+    def __len__(self):
+        return self.root.size
 
     # To retrieve the ride with the ride_num equal to the key
     def get_ride(self, key):
-        temp = self.root
-
-        # Iterating through the tree to find the node with ride_num equal to the key
-        while temp != self.null_node:
-            if temp.ride.ride_num == key:
-                return temp
-            elif temp.ride.ride_num < key:
-                temp = temp.right
-            else:
-                temp = temp.left
+        # The RBTNode of the ride, or None if the ride with the specified ride_num was not found
+        return self.nodes.get(key)
 
-        # If the ride with the specified ride_num was not found, return None
-        return None
+    def iter_nodes(self, low, high, limit=None, cursor=None):
+        """
+        Lazily yield the RBTNodes with low <= ride_num <= high in ascending order of ride_num.
+
+        The in-order walk uses an explicit stack instead of recursion, never enters subtrees that lie entirely
+        below low and stops at the first ride_num above high.
 
-    def findrange(self, node, low, high, res):
-        if node == self.null_node:
+        Parameters:
+        limit (int): Stop after this many rides (None for no limit).
+        cursor (int): Only yield rides with ride_num greater than cursor, i.e. resume after the last ride of a page.
+        """
+        if cursor is not None and cursor >= low:
+            low = cursor + 1
+        if limit is not None and limit <= 0:
             return
 
-        # Traverse left subtree if the current node's ride_num is greater than low
-        if low < node.ride.ride_num:
-            self.findrange(node.left, low, high, res)
+        null_node = self.null_node
+        stack = []
+        node = self.root
+        count = 0
+
+        while stack or node != null_node:
+            # Go down to the smallest ride_num >= low, skipping left subtrees that are out of range
+            while node != null_node:
+                if node.key < low:
+                    node = node.right
+                else:
+                    stack.append(node)
+                    node = node.left
 
-        # Add the current ride to result list if it falls within the range [low, high]
-        if low <= node.ride.ride_num <= high:
-            res.append(node.ride)
+            if not stack:
+                return
+            node = stack.pop()
 
-        # Traverse right subtree if the current node's ride_num is less than high
-        self.findrange(node.right, low, high, res)
+            # Everything after this node is larger, so the range is exhausted
+            if node.key > high:
+                return
 
-    def getrange(self, low, high):
-        res = []
-        # Call the helper function to find rides falling within the range [low, high]
-        self.findrange(self.root, low, high, res)
-        # Return the list of rides falling within the range
-        return res
+            yield node
+            count += 1
+            if count == limit:
+                return
+
+            # Continue with the in-order successors in the right subtree
+            node = node.right
+
+    def iter_all_nodes(self):
+        # Every RBTNode in ascending order of key
+        return self.iter_nodes(float("-inf"), float("inf"))
+
+    def count_below(self, key, inclusive=False):
+        # Number of rides with ride_num < key (<= key if inclusive), one descent using the subtree sizes
+        count = 0
+        node = self.root
+        while node != self.null_node:
+            if node.key < key or (inclusive and node.key == key):
+                # This node and its whole left subtree are below the key
+                count += node.left.size + 1
+                node = node.right
+            else:
+                node = node.left
+        return count
+
+    def select(self, k):
+        # The RBTNode holding the k-th smallest ride_num (1-based), or None if there are fewer than k rides
+        if k < 1 or k > self.root.size:
+            return None
+        node = self.root
+        while True:
+            left_size = node.left.size
+            if k <= left_size:
+                node = node.left
+            elif k == left_size + 1:
+                return node
+            else:
+                k -= left_size + 1
+                node = node.right
+
+    def build(self, nodes):
+        """
+        Replace the contents of the tree with the given RBTNodes, which must be sorted by key, in O(n).
+
+        The tree is linked directly as a balanced tree without any rotations: every node is black except the
+        nodes on the deepest level when that level is not full, which are red. Since all leaves of a balanced
+        tree are on its last two levels, every path from the root then has the same number of black nodes.
+        """
+        null_node = self.null_node
+        count = len(nodes)
+
+        # Depth of the deepest level, and whether that level is completely filled (count == 2^k - 1)
+        max_depth = count.bit_length() - 1
+        red_depth = -1 if (count + 1) & count == 0 else max_depth
+
+        def link(low, high, parent, depth):
+            # Link nodes[low..high] below parent and return the root of that subtree
+            if low > high:
+                return null_node
+            mid = (low + high) // 2
+            node = nodes[mid]
+            node.pp = parent
+            node.color = 1 if depth == red_depth else 0
+            node.left = link(low, mid - 1, node, depth + 1)
+            node.right = link(mid + 1, high, node, depth + 1)
+            node.size = high - low + 1
+            return node
+
+        self.root = link(0, count - 1, None, 0)
+        self.nodes = {node.key: node for node in nodes}
 
     def repnode(self, node, c_node):
         # If the node to be replaced is the root node
@@ -211,21 +870,8 @@ class RedBlackTree:
         # Update the parent pointer of the child node to be the same as the parent of the original node
         c_node.pp = node.pp
 
-    def deletenodehelp(self, node, key):
-        # Search for the node to delete
-        deleten = self.null_node
-        while node != self.null_node:
-            if node.ride.ride_num == key:
-                deleten = node
-            if node.ride.ride_num >= key:
-                node = node.left
-            else:
-                node = node.right
-
-        # If the node to delete is not found, return
-        if deleten == self.null_node:
-            return
-
+    def delete_node(self, deleten):
+        # Splice the given RBTNode out of the tree (deleten has already dropped it from the hash index)
         # Get the min heap node associated with the node to delete
         heap_node = deleten.min_heap_node
 
@@ -258,6 +904,12 @@ class RedBlackTree:
             y.left.pp = y
             y.color = deleten.color
 
+        # Only the subtrees on the path from the spliced out position up to the root lost a node
+        node = x.pp
+        while node is not None:
+            node.size = node.left.size + node.right.size + 1
+            node = node.pp
+
         # If the color of the node spliced out was black, fix the tree to maintain red-black properties
         if y_original_color == 0:
             self.post_delete_fix(x)
@@ -426,6 +1078,10 @@ class RedBlackTree:
         y.left = x
         x.pp = y
 
+        # y takes over the subtree of x, x keeps its left subtree and the old left subtree of y
+        y.size = x.size
+        x.size = x.left.size + x.right.size + 1
+
     def rightro(self, x):
         # Store the left child of x in y
         y = x.left
@@ -452,54 +1108,441 @@ class RedBlackTree:
         y.right = x
         x.pp = y
 
-    def insert(self, ride, min_heap):
-        # Create a new node with the given ride and min_heap
-        node = RBTNode(ride, min_heap)
-
-        # Set the node's parent, left child, right child, and color
-        node.pp = None
-        node.left = self.null_node
-        node.right = self.null_node
-        node.color = 1
+        # y takes over the subtree of x, x keeps its right subtree and the old right subtree of y
+        y.size = x.size
+        x.size = x.left.size + x.right.size + 1
 
+    def insert(self, ride, min_heap):
+        # Insert the ride and return the RBTNode created for it
         # Traverse the tree to find the correct position to insert the node
         insertion_node = None
         temp_node = self.root
 
+        key = self.ride_key(ride)
         while temp_node != self.null_node:
             insertion_node = temp_node
-            if node.ride.ride_num < temp_node.ride.ride_num:
+            if key < temp_node.key:
                 temp_node = temp_node.left
             else:
                 temp_node = temp_node.right
 
+        return self.attach(ride, min_heap, insertion_node)
+
+    def insert_if_absent(self, ride, min_heap):
+        """
+        Insert the ride unless its ride_num is already in the tree; the duplicate check is a hash lookup and
+        only a new ride descends the tree.
+
+        Returns a tuple (node, inserted): the new RBTNode and True, or the existing RBTNode and False.
+        """
+        key = self.ride_key(ride)
+        existing = self.nodes.get(key)
+        if existing is not None:
+            return existing, False
+
+        # A new key, only its place in the tree is left to find
+        insertion_node = None
+        temp_node = self.root
+        while temp_node != self.null_node:
+            insertion_node = temp_node
+            if key < temp_node.key:
+                temp_node = temp_node.left
+            else:
+                temp_node = temp_node.right
+
+        return self.attach(ride, min_heap, insertion_node), True
+
+    def attach(self, ride, min_heap, insertion_node):
+        # Create a new node with the given ride and min_heap
+        node = RBTNode(ride, min_heap, self.ride_key(ride))
+        self.nodes[node.key] = node
+
+        # Set the node's parent, left child, right child, and color
+        node.pp = None
+        node.left = self.null_node
+        node.right = self.null_node
+        node.color = 1
+
         # Set the node's parent to the insertion_node, and update the insertion_node's children
         node.pp = insertion_node
         if insertion_node is None:
             self.root = node
-        elif node.ride.ride_num > insertion_node.ride.ride_num:
+        elif node.key > insertion_node.key:
             insertion_node.right = node
         else:
             insertion_node.left = node
 
+        # Every subtree on the path from the root gained one node
+        ancestor = insertion_node
+        while ancestor is not None:
+            ancestor.size += 1
+            ancestor = ancestor.pp
+
         # If the node's parent is the root, color the node black and return
         if node.pp is None:
             node.color = 0
-            return
+            return node
 
         # If the node's grandparent is None, return
         if node.pp.pp is None:
-            return
+            return node
 
         # Fix the tree to maintain the properties of a red-black tree after insertion
         self.post_insert_fix(node)
+        return node
 
     def deleten(self, ride_num):
-        # Call the recursive helper method to delete the node with the given ride_num
-        return self.deletenodehelp(self.root, ride_num)
+        # Delete the node with the given ride_num and return its MinHeapNode (None if it is not in the tree)
+        node = self.nodes.pop(ride_num, None)
+        if node is None:
+            return None
+        return self.delete_node(node)
+
+    def new_node(self, ride, min_heap_node):
+        # The node this tree stores a ride in, for building it with build
+        return RBTNode(ride, min_heap_node, self.ride_key(ride))
+
+
+class CostIndex(RedBlackTree):
+    """
+    Secondary index over the rides of a RedBlackTree, ordered by (cost_ride, triptime, ride_num).
+
+    The nodes share the Ride and MinHeapNode objects of the main tree and the heap. The ride_num makes every
+    key unique, and (cost_ride, triptime) is the heap order, so the index lists rides in dispatch order.
+    """
+
+    def ride_key(self, ride):
+        return (ride.cost_ride, ride.triptime, ride.ride_num)
+
+    def iter_all_nodes(self):
+        # Keys are tuples, the empty tuple sorts before all of them
+        return self.iter_nodes((), (float("inf"),))
+
+    def iter_cost_range(self, low, high):
+        # RBTNodes of the rides with low <= cost_ride <= high, in dispatch order
+        return self.iter_nodes((low,), (high, float("inf")))
+
+    def load(self, rbt):
+        # Rebuild the index from every ride of the main tree
+        nodes = [RBTNode(node.ride, node.min_heap_node, self.ride_key(node.ride)) for node in rbt.iter_all_nodes()]
+        nodes.sort(key=lambda node: node.key)
+        self.build(nodes)
+
+    def add(self, ride, min_heap_node):
+        self.insert(ride, min_heap_node)
+
+    def remove(self, ride):
+        # The ride is found by its current key, so remove it before its cost or trip duration changes
+        self.deleten(self.ride_key(ride))
+
+
+def cost_index(rbt):
+    # The CostIndex of the tree's rides; built the first time it is asked for and kept up to date from then on
+    if rbt.cost_index is None:
+        rbt.cost_index = CostIndex()
+        rbt.cost_index.load(rbt)
+    return rbt.cost_index
+
+
+# SortedBlockIndex keeps between BLOCK_SIZE / 4 and 2 * BLOCK_SIZE rides per block (fewer only in the last one)
+BLOCK_SIZE = 512
+
+
+class IndexEntry:
+    __slots__ = ("ride", "min_heap_node", "key")
+
+    def __init__(self, ride, min_heap_node, key):
+        # The SortedBlockIndex counterpart of an RBTNode: the ride, its MinHeapNode and the key it is sorted by
+        self.ride = ride
+        self.min_heap_node = min_heap_node
+        self.key = key
+
+
+class SortedBlockIndex(OrderedIndex):
+    """
+    OrderedIndex of the rides by ride_num, an alternative to RedBlackTree stored as a sorted list of blocks of a
+    few hundred rides instead of one linked node per ride.
+
+    blocks[i] holds IndexEntries in ascending order of key and keys[i] the same keys as a plain list, so that
+    a lookup is a bisect over the last key of every block (maxes) followed by a bisect inside one block, both
+    in C over contiguous arrays. A range is read as slices of whole blocks. An insert or delete shifts at most
+    2 * BLOCK_SIZE pointers of one block, the position counts used by count_below and select are rebuilt only
+    when they are asked for after a change.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.keys = []
+        self.blocks = []
+        self.maxes = []
+        # offsets[i] is the number of rides in the blocks before block i; None after a change
+        self.offsets = None
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def new_node(self, ride, min_heap_node):
+        # The entry this index stores a ride in, for building it with build
+        return IndexEntry(ride, min_heap_node, self.ride_key(ride))
+
+    def locate(self, key):
+        # (block, position) of the first key >= the given one; block is len(blocks) if every key is smaller
+        block = bisect.bisect_left(self.maxes, key)
+        if block == len(self.maxes):
+            return block, 0
+        return block, bisect.bisect_left(self.keys[block], key)
+
+    def get_ride(self, key):
+        # The entry of the ride with ride_num equal to the key, or None
+        block = bisect.bisect_left(self.maxes, key)
+        if block == len(self.maxes):
+            return None
+        keys = self.keys[block]
+        position = bisect.bisect_left(keys, key)
+        if keys[position] == key:
+            return self.blocks[block][position]
+        return None
+
+    def iter_nodes(self, low, high, limit=None, cursor=None):
+        """
+        Lazily yield the entries with low <= ride_num <= high in ascending order of ride_num.
+
+        Parameters:
+        limit (int): Stop after this many rides (None for no limit).
+        cursor (int): Only yield rides with ride_num greater than cursor, i.e. resume after the last ride of a page.
+        """
+        if cursor is not None and cursor >= low:
+            low = cursor + 1
+        if limit is not None and limit <= 0:
+            return
+        nodes = self.iter_slices(low, high)
+        if limit is not None:
+            nodes = itertools.islice(nodes, limit)
+        yield from nodes
+
+    def iter_slices(self, low, high):
+        # The entries in [low, high], one slice of a block at a time
+        block, position = self.locate(low)
+        maxes = self.maxes
+        while block < len(maxes):
+            if maxes[block] <= high:
+                # The whole rest of the block is in the range
+                yield from self.blocks[block][position:]
+            else:
+                end = bisect.bisect_right(self.keys[block], high)
+                yield from self.blocks[block][position:end]
+                return
+            block += 1
+            position = 0
+
+    def iter_all_nodes(self):
+        # Every entry in ascending order of key
+        return itertools.chain.from_iterable(self.blocks)
+
+    def block_offsets(self):
+        if self.offsets is None:
+            self.offsets = [0]
+            self.offsets.extend(itertools.accumulate(map(len, self.keys)))
+        return self.offsets
+
+    def count_below(self, key, inclusive=False):
+        # Number of rides with ride_num < key (<= key if inclusive)
+        search = bisect.bisect_right if inclusive else bisect.bisect_left
+        block = search(self.maxes, key)
+        if block == len(self.maxes):
+            return self.size
+        return self.block_offsets()[block] + search(self.keys[block], key)
+
+    def select(self, k):
+        # The entry holding the k-th smallest ride_num (1-based), or None if there are fewer than k rides
+        if k < 1 or k > self.size:
+            return None
+        offsets = self.block_offsets()
+        block = bisect.bisect_left(offsets, k) - 1
+        return self.blocks[block][k - 1 - offsets[block]]
+
+    def build(self, nodes):
+        # Replace the contents of the index with the given entries, which must be sorted by key, in O(n)
+        self.blocks = [nodes[start:start + BLOCK_SIZE] for start in range(0, len(nodes), BLOCK_SIZE)]
+        self.keys = [[node.key for node in block] for block in self.blocks]
+        self.maxes = [keys[-1] for keys in self.keys]
+        self.offsets = None
+        self.size = len(nodes)
+
+    def insert(self, ride, min_heap):
+        # Insert the ride and return the entry created for it
+        key = self.ride_key(ride)
+        block = bisect.bisect_right(self.maxes, key)
+        return self.attach(ride, min_heap, block, key, bisect.bisect_right)
+
+    def insert_if_absent(self, ride, min_heap):
+        """
+        Insert the ride unless its ride_num is already in the index, using a single lookup.
+
+        Returns a tuple (node, inserted): the new entry and True, or the existing entry and False.
+        """
+        key = self.ride_key(ride)
+        block, position = self.locate(key)
+        if block < len(self.maxes) and self.keys[block][position] == key:
+            return self.blocks[block][position], False
+        return self.attach(ride, min_heap, block, key, bisect.bisect_left), True
+
+    def attach(self, ride, min_heap, block, key, search):
+        # Store a new entry in the given block (len(blocks) for a key above all others) and return it
+        node = IndexEntry(ride, min_heap, key)
+        if not self.maxes:
+            self.keys.append([key])
+            self.blocks.append([node])
+            self.maxes.append(key)
+        else:
+            if block == len(self.maxes):
+                # A new largest key goes at the end of the last block
+                block -= 1
+                self.maxes[block] = key
+            keys = self.keys[block]
+            position = search(keys, key)
+            keys.insert(position, key)
+            self.blocks[block].insert(position, node)
+            if len(keys) > 2 * BLOCK_SIZE:
+                self.split(block)
+        self.size += 1
+        self.offsets = None
+        return node
+
+    def split(self, block):
+        # Cut a full block into two halves
+        keys, nodes = self.keys[block], self.blocks[block]
+        self.keys[block + 1:block + 1] = [keys[BLOCK_SIZE:]]
+        self.blocks[block + 1:block + 1] = [nodes[BLOCK_SIZE:]]
+        del keys[BLOCK_SIZE:]
+        del nodes[BLOCK_SIZE:]
+        self.maxes.insert(block, keys[-1])
+
+    def deleten(self, ride_num):
+        # Delete the ride with the given ride_num and return its MinHeapNode (None if it is not in the index)
+        block, position = self.locate(ride_num)
+        if block == len(self.maxes) or self.keys[block][position] != ride_num:
+            return None
+        keys, nodes = self.keys[block], self.blocks[block]
+        del keys[position]
+        heap_node = nodes.pop(position).min_heap_node
+        self.size -= 1
+        self.offsets = None
+
+        if len(keys) < BLOCK_SIZE // 4:
+            self.merge(block)
+        elif position == len(keys):
+            self.maxes[block] = keys[-1]
+        return heap_node
+
+    def merge(self, block):
+        # Join a block that got too small with its right neighbour (or drop it when it is empty)
+        keys, nodes = self.keys[block], self.blocks[block]
+        if block + 1 < len(self.maxes):
+            keys.extend(self.keys.pop(block + 1))
+            nodes.extend(self.blocks.pop(block + 1))
+            del self.maxes[block + 1]
+        if not keys:
+            del self.keys[block], self.blocks[block], self.maxes[block]
+            return
+        self.maxes[block] = keys[-1]
+        if len(keys) > 2 * BLOCK_SIZE:
+            self.split(block)
+
+# Ordered index backends selectable with --index
+INDEX_BACKENDS = {
+    "rbt": RedBlackTree,
+    "blocks": SortedBlockIndex,
+}
+
+
+# Print(low, high) results of more rides than this are streamed to the output and never cached
+RANGE_CACHE_MAX_RIDES = 4096
+
+
+class RangeCache:
+    """
+    Bounded LRU cache of formatted Print(low, high) lines, keyed by (low, high).
+
+    Every change to a ride (insert, dispatch, cancel, update, reprice) must call invalidate with its ride_num,
+    which drops exactly the cached ranges that contain it; all other ranges stay valid. The cached ranges
+    are few, so they are scanned, after a check against the span [low, high] they cover together that lets
+    most changes through at once.
+    """
+
+    def __init__(self, capacity, max_rides=RANGE_CACHE_MAX_RIDES):
+        """
+        Parameters:
+        capacity (int): Number of ranges kept; the least recently printed one is evicted first.
+        max_rides (int): Ranges holding more rides are not cached.
+        """
+        self.capacity = capacity
+        self.max_rides = max_rides
+        self.entries = OrderedDict()
+        # Smallest low and largest high of the cached ranges (only widened until the cache runs empty)
+        self.low = self.high = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, low, high):
+        # The cached line of the range, or None
+        line = self.entries.get((low, high))
+        if line is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end((low, high))
+        return line
+
+    def put(self, low, high, line):
+        entries = self.entries
+        if not entries:
+            self.low, self.high = low, high
+        else:
+            self.low, self.high = min(self.low, low), max(self.high, high)
+        entries[(low, high)] = line
+        if len(entries) > self.capacity:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, ride_num):
+        # Drop the cached ranges that contain the ride_num
+        if not self.entries or not self.low <= ride_num <= self.high:
+            return
+        self.drop([key for key in self.entries if key[0] <= ride_num <= key[1]])
+
+    def invalidate_many(self, ride_nums):
+        # Drop the cached ranges that contain any of the ride_nums
+        if not self.entries:
+            return
+        ordered = sorted(ride_nums)
+        stale = []
+        for key in self.entries:
+            # The smallest ride_num >= low decides whether the range holds one of them
+            position = bisect.bisect_left(ordered, key[0])
+            if position < len(ordered) and ordered[position] <= key[1]:
+                stale.append(key)
+        self.drop(stale)
+
+    def drop(self, keys):
+        for key in keys:
+            del self.entries[key]
+        self.invalidations += len(keys)
+        if not self.entries:
+            self.low = self.high = None
+
+    def stats(self):
+        # Counters for sizing the cache
+        return {"capacity": self.capacity, "size": len(self.entries), "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "invalidations": self.invalidations}
 
 
 class Ride:
+    __slots__ = ("ride_num", "cost_ride", "triptime")
+
     def __init__(self, ride_num, cost_ride, triptime):
         # Initialize a new Ride object with the given ride number, cost, and trip duration.
         self.ride_num = ride_num
@@ -529,69 +1572,270 @@ class Ride:
 
 
 
-def insert_ride(ride, heap, rbt):
-    # Check if the ride_num already exists in the Red-Black Tree
-    if rbt.get_ride(ride.ride_num) is not None:
-        write_to_output(None, "Duplicate ride_num", False)
-        sys.exit(0)
-        return
+def insert_ride(ride, heap, rbt, sink=None, exit_on_duplicate=True):
+    # Returns False if the ride_num was a duplicate (only when exit_on_duplicate is False)
+    # Create the MinHeapNode for the ride, its RBTNode is created by the tree insert
+    min_heap_node = heap.new_node(ride)
 
-    # Create a new RBTNode and MinHeapNode for the ride
-    rbt_node = RBTNode(None, None)
-    min_heap_node = MinHeapNode(ride, rbt_node, heap.curr_size + 1)
+    # Insert the ride into the Red-Black Tree unless the ride_num already exists (one descent for both)
+    rbt_node, inserted = rbt.insert_if_absent(ride, min_heap_node)
+    if not inserted:
+        write_to_output(None, "Duplicate ride_num", False, sink)
+        # A batch run stops at the first duplicate, a long running dispatcher only rejects the ride
+        if exit_on_duplicate:
+            sys.exit(0)
+        return False
 
-    # Insert the MinHeapNode into the Min Heap and the ride into the Red-Black Tree
+    # Link the two nodes and insert the MinHeapNode into the Min Heap
+    min_heap_node.rbt_node = rbt_node
     heap.insert(min_heap_node)
-    rbt.insert(ride, min_heap_node)
+    if rbt.cost_index is not None:
+        rbt.cost_index.add(ride, min_heap_node)
+    if rbt.range_cache is not None:
+        rbt.range_cache.invalidate(ride.ride_num)
+    return True
 
 
-def print_ride(ride_num, rbt):
+def first_duplicate(ride_nums, rbt):
+    # Position of the first ride_num already taken, by the tree or by an earlier one of ride_nums; None if all are new
+    seen = set()
+    for count, ride_num in enumerate(ride_nums):
+        if ride_num in seen or rbt.get_ride(ride_num) is not None:
+            return count
+        seen.add(ride_num)
+    return None
+
+
+def bulk_insert(rides, heap, rbt, sink=None, exit_on_duplicate=True):
+    """
+    Insert a batch of rides, with the same result as calling insert_ride on each of them in order.
+
+    Duplicates are found in one pass over the batch. Small batches into a large tree go through insert_ride;
+    otherwise the Min Heap is rebuilt with a linear-time heapify and the Red-Black Tree is rebuilt as a
+    balanced tree from the merged, sorted ride_nums, without any rotations.
+    """
+    while True:
+        count = first_duplicate((ride.ride_num for ride in rides), rbt)
+        if count is None:
+            load_unique_rides(rides, heap, rbt, sink)
+            return
+        load_unique_rides(rides[:count], heap, rbt, sink)
+        rides = rides[count + 1:]
+
+        # Report the duplicate exactly like insert_ride would have after inserting the rides before it
+        write_to_output(None, "Duplicate ride_num", False, sink)
+        if exit_on_duplicate:
+            sys.exit(0)
+
+
+def load_unique_rides(rides, heap, rbt, sink=None):
+    # Insert rides whose ride_nums are known to be new, for bulk_insert
+    if len(rides) < heap.curr_size:
+        # A small batch into a large tree, inserting one by one is cheaper than relinking everything
+        for ride in rides:
+            insert_ride(ride, heap, rbt, sink)
+    elif rides:
+        # Only new, live objects are allocated here; pause the cyclic garbage collector so it does not
+        # rescan the ever growing set of nodes over and over while they are created
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            # Create and cross-link the nodes of the new rides, in ride_num order
+            new_nodes = []
+            heap_nodes = []
+            for ride in sorted(rides, key=lambda r: r.ride_num):
+                heap_node = heap.new_node(ride)
+                rbt_node = rbt.new_node(ride, heap_node)
+                heap_node.rbt_node = rbt_node
+                heap_nodes.append(heap_node)
+                new_nodes.append(rbt_node)
+
+            # Merge with the rides already in the tree (two sorted runs, so the sort is a linear merge) and relink
+            tree_nodes = list(rbt.iter_all_nodes())
+            tree_nodes.extend(new_nodes)
+            tree_nodes.sort(key=lambda node: node.ride.ride_num)
+            rbt.build(tree_nodes)
+
+            heap.heapify(heap_nodes)
+            if rbt.cost_index is not None:
+                rbt.cost_index.load(rbt)
+            if rbt.range_cache is not None:
+                rbt.range_cache.invalidate_many([ride.ride_num for ride in rides])
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+
+def print_ride(ride_num, rbt, sink=None):
     # Get the ride corresponding to the ride number from the Red-Black Tree
     res = rbt.get_ride(ride_num)
 
     # If the ride does not exist, add a dummy ride to the output with a message
     if res is None:
-        write_to_output(Ride(0, 0, 0), "Ride not found", False)
+        write_to_output(Ride(0, 0, 0), "Ride not found", False, sink)
     # If the ride exists, add it to the output without a message
     else:
-        write_to_output(res.ride, "", False)
+        write_to_output(res.ride, "", False, sink)
 
 
-def print_rides(lower_bound, upper_bound, rbt):
+def print_rides(lower_bound, upper_bound, rbt, sink=None):
     """
     Prints all rides whose ride numbers are within the specified range [lower_bound, upper_bound],
     using the provided Red-Black Tree object. The rides are printed to the output file in ascending order
     of ride numbers.
+
+    With a RangeCache on the tree the formatted line is reused until one of its rides changes.
     """
-    rides = rbt.getrange(lower_bound, upper_bound)
-    write_to_output(rides, "", True)
+    cache = rbt.range_cache
+    if cache is not None:
+        line = cache.get(lower_bound, upper_bound)
+        if line is None and rbt.count_range(lower_bound, upper_bound) <= cache.max_rides:
+            line = ",".join([f"({r.ride_num},{r.cost_ride},{r.triptime})"
+                             for r in rbt.iter_range(lower_bound, upper_bound)]) or "(0,0,0)"
+            cache.put(lower_bound, upper_bound, line)
+        if line is not None:
+            write_to_output(None, line, False, sink)
+            return
+
+    # The rides are streamed from the tree straight into the output
+    rides = rbt.iter_range(lower_bound, upper_bound)
+    write_to_output(rides, "", True, sink)
 
 
 
-def get_next_ride(heap, rbt):
+def get_next_ride(heap, rbt, sink=None):
+    # Returns the dispatched ride, or None if there was none
+    ride = None
     # If the Min Heap is not empty, pop the top element from the heap
     if heap.curr_size != 0:
         popped_node = heap.pop()
+        ride = popped_node.ride
         # Delete the corresponding node from the Red-Black Tree
-        rbt.deleten(popped_node.ride.ride_num)
+        rbt.deleten(ride.ride_num)
+        if rbt.cost_index is not None:
+            rbt.cost_index.remove(ride)
+        if rbt.range_cache is not None:
+            rbt.range_cache.invalidate(ride.ride_num)
         # Output the popped ride to the user
-        write_to_output(popped_node.ride, "", False)
+        write_to_output(ride, "", False, sink)
     else:
         # If the Min Heap is empty, output "No active ride requests" to the user
-        write_to_output(None, "No active ride requests", False)
+        write_to_output(None, "No active ride requests", False, sink)
+
+    # Latency-sensitive consumers want every dispatched ride on disk immediately
+    if sink is not None and sink.flush_on_next_ride:
+        sink.flush()
+    return ride
 
 
 
+def get_next_rides(count, heap, rbt, sink=None):
+    """
+    Dispatch the count cheapest rides, with the same output as count GetNextRide commands.
+
+    The rides are popped in priority order, removed from the tree as one batch and written in a single write.
+    Returns the dispatched rides.
+    """
+    rides = []
+    while len(rides) < count and heap.curr_size != 0:
+        rides.append(heap.pop().ride)
+    rbt.delete_many([ride.ride_num for ride in rides])
+    if rbt.cost_index is not None:
+        rbt.cost_index.delete_many([rbt.cost_index.ride_key(ride) for ride in rides])
+    if rbt.range_cache is not None:
+        rbt.range_cache.invalidate_many([ride.ride_num for ride in rides])
+
+    if rides:
+        write_to_output(None, "\n".join(f"({ride.ride_num},{ride.cost_ride},{ride.triptime})" for ride in rides),
+                        False, sink)
+    # Every GetNextRide after the heap ran empty reports it, written in bounded chunks however large count is
+    if count > len(rides):
+        if sink is None:
+            with OutputSink("output_file.txt", "a") as file_sink:
+                file_sink.write_repeated("No active ride requests", count - len(rides))
+        else:
+            sink.write_repeated("No active ride requests", count - len(rides))
+
+    if sink is not None and sink.flush_on_next_ride:
+        sink.flush()
+    return rides
+
+
+def peek_next_ride(heap, sink=None):
+    # Write the ride GetNextRide would dispatch, leaving it in place
+    node = heap.peek()
+    if node is None:
+        write_to_output(None, "No active ride requests", False, sink)
+    else:
+        write_to_output(node.ride, "", False, sink)
+
+
+def top_rides(k, heap, sink=None):
+    # Write the k cheapest rides on one line in dispatch order, without dispatching them
+    nodes = heap.top_k(k)
+    if nodes:
+        write_to_output([node.ride for node in nodes], "", True, sink)
+    else:
+        write_to_output(None, "No active ride requests", False, sink)
+
+
 def cancel_ride(ride_number, heap, rbt):
     # Delete the ride from the Red-Black Tree and obtain the corresponding heap node
     heap_node = rbt.deleten(ride_number)
 
     # If the heap node exists, delete the corresponding element from the Min Heap
     if heap_node is not None:
-        heap.delete_element(heap_node.min_heap_index)
+        heap.delete_node(heap_node)
+        if rbt.cost_index is not None:
+            rbt.cost_index.remove(heap_node.ride)
+        if rbt.range_cache is not None:
+            rbt.range_cache.invalidate(ride_number)
+
+
+def print_by_cost(low, high, rbt, sink=None):
+    # Write the rides with low <= cost_ride <= high on one line in dispatch order, from the cost index
+    rides = (node.ride for node in cost_index(rbt).iter_cost_range(low, high))
+    write_to_output(rides, "", True, sink)
 
 
-def update_ride(ride_num, new_duration, heap, rbt):
+def reprice_rides(low, high, delta, heap, rbt):
+    """
+    Add delta to the cost of every ride with low <= cost_ride <= high, e.g. for surge pricing.
+
+    The rides are found with one range walk of the cost index and their heap keys are changed as one batch.
+    The index is then fixed up per ride, or relinked with one sort and build when much of it moved.
+    """
+    index = cost_index(rbt)
+    nodes = list(index.iter_cost_range(low, high))
+    if not nodes or delta == 0:
+        return
+    if rbt.range_cache is not None:
+        rbt.range_cache.invalidate_many([node.ride.ride_num for node in nodes])
+
+    if len(nodes) * BATCH_DELETE_REBUILD_RATIO < index.root.size:
+        for node in nodes:
+            index.deleten(node.key)
+        heap.reprice_many([node.min_heap_node for node in nodes], delta)
+        for node in nodes:
+            index.add(node.ride, node.min_heap_node)
+        return
+
+    # Collect the nodes while their keys still match the tree, then re-key the repriced ones and relink
+    all_nodes = list(index.iter_all_nodes())
+    heap.reprice_many([node.min_heap_node for node in nodes], delta)
+    for node in nodes:
+        node.key = index.ride_key(node.ride)
+    # Both the untouched rides and the shifted band are still sorted runs, so this sort is a cheap merge
+    all_nodes.sort(key=lambda node: node.key)
+    index.build(all_nodes)
+
+
+def count_rides(lower_bound, upper_bound, rbt, sink=None):
+    # Write the number of rides with ride numbers in [lower_bound, upper_bound], counted from the subtree sizes
+    write_to_output(None, str(rbt.count_range(lower_bound, upper_bound)), False, sink)
+
+
+def update_ride(ride_num, new_duration, heap, rbt, sink=None):
     # Get the ride from the Red-Black Tree
     rbt_node = rbt.get_ride(ride_num)
 
@@ -599,88 +1843,588 @@ def update_ride(ride_num, new_duration, heap, rbt):
     if rbt_node is None:
         print("")
     else:
+        # The cost index finds rides by (cost, triptime), so a ride that stays is re-keyed there around the update
+        rekey_cost_index = rbt.cost_index is not None and new_duration <= 2 * rbt_node.ride.triptime
+        if rekey_cost_index:
+            rbt.cost_index.remove(rbt_node.ride)
+
         # If new duration is less than or equal to current duration, just update the heap
         if new_duration <= rbt_node.ride.triptime:
-            heap.update_element(rbt_node.min_heap_node.min_heap_index, new_duration)
-        # If the new duration is between current duration and twice the current duration, cancel the ride and insert a new ride with updated duration and cost
+            heap.update_node(rbt_node.min_heap_node, new_duration)
+        # If the new duration is between current duration and twice the current duration, charge 10 more for the ride
+        # and use the new duration; the ride_num is unchanged, so the ride keeps its tree node and is only re-sifted in the heap
         elif rbt_node.ride.triptime < new_duration <= (2 * rbt_node.ride.triptime):
-            cancel_ride(rbt_node.ride.ride_num, heap, rbt)
-            insert_ride(Ride(rbt_node.ride.ride_num, rbt_node.ride.cost_ride + 10, new_duration), heap, rbt)
+            heap.reprice_node(rbt_node.min_heap_node, rbt_node.ride.cost_ride + 10, new_duration)
         # If the new duration is more than twice the current duration, cancel the ride
         else:
             cancel_ride(rbt_node.ride.ride_num, heap, rbt)
 
-def write_to_output(ride, message, is_list):
-    # Open the output file in append mode
-    with open("output_file.txt", "a") as file:
-        # If the ride is None, write the message to the output file
-        if ride is None:
-            file.write(message + "\n")
+        if rekey_cost_index:
+            rbt.cost_index.add(rbt_node.ride, rbt_node.min_heap_node)
+        if rbt.range_cache is not None:
+            rbt.range_cache.invalidate(ride_num)
+
+
+def update_rides(ride_nums, new_durations, heap, rbt):
+    """
+    Apply UpdateTrip(ride_nums[i], new_durations[i]) for every i, with the same result as calling update_ride
+    for each of them in order.
+
+    Updates of different rides do not affect each other, so a ride_num that occurs more than once is updated
+    in rounds (its k-th update in round k) and each round is applied as one batch: the three-way comparison
+    with triptime and 2 * triptime is done in one loop over the round, the cancelled rides are deleted from
+    the tree together, and the heap gets all of the new keys and removals at once through rekey_many.
+
+    Parameters:
+    ride_nums, new_durations: Sequences of ints of the same length.
+    """
+    # Usually every ride_num is distinct and there is a single round
+    if len(set(ride_nums)) == len(ride_nums):
+        update_ride_batch(ride_nums, new_durations, heap, rbt)
+        return
+
+    rounds = []
+    seen = {}
+    for ride_num, new_duration in zip(ride_nums, new_durations):
+        occurrence = seen.get(ride_num, 0)
+        seen[ride_num] = occurrence + 1
+        if occurrence == len(rounds):
+            rounds.append(([], []))
+        rounds[occurrence][0].append(ride_num)
+        rounds[occurrence][1].append(new_duration)
+
+    for round_ride_nums, round_durations in rounds:
+        update_ride_batch(round_ride_nums, round_durations, heap, rbt)
+
+
+def update_ride_batch(ride_nums, new_durations, heap, rbt):
+    # One round of update_rides: every ride_num occurs at most once
+    get_ride = rbt.get_ride
+    # (MinHeapNode, new cost, new triptime) of the rides that stay, MinHeapNodes of the cancelled ones
+    updates = []
+    removals = []
+    # Classify every update: cancelled if new > 2 * triptime, +10 surcharge if triptime < new <= 2 * triptime
+    for ride_num, new_triptime in zip(ride_nums, new_durations):
+        rbt_node = get_ride(ride_num)
+        if rbt_node is None:
+            # Same as update_ride for a ride that does not exist
+            print("")
+            continue
+        ride = rbt_node.ride
+        if new_triptime > 2 * ride.triptime:
+            removals.append(rbt_node.min_heap_node)
+        elif new_triptime > ride.triptime:
+            updates.append((rbt_node.min_heap_node, ride.cost_ride + 10, new_triptime))
         else:
-            # If the ride is not None, write the ride information to the output file
-            if not is_list:
-                # If the ride is not a list, write the ride information as a string
-                message = f"({ride.ride_num},{ride.cost_ride},{ride.triptime})\n"
+            updates.append((rbt_node.min_heap_node, ride.cost_ride, new_triptime))
+    if not updates and not removals:
+        return
+
+    # The cost index finds rides by their current key, so it is fixed up around the change or rebuilt after it
+    index = rbt.cost_index
+    changed = len(updates) + len(removals)
+    rebuild_index = index is not None and changed * BATCH_DELETE_REBUILD_RATIO >= index.root.size
+    if index is not None and not rebuild_index:
+        for heap_node, _, _ in updates:
+            index.remove(heap_node.ride)
+        for heap_node in removals:
+            index.remove(heap_node.ride)
+
+    rbt.delete_many([heap_node.ride.ride_num for heap_node in removals])
+    heap.rekey_many(updates, removals)
+
+    if rebuild_index:
+        index.load(rbt)
+    elif index is not None:
+        for heap_node, _, _ in updates:
+            index.add(heap_node.ride, heap_node)
+
+    if rbt.range_cache is not None:
+        rbt.range_cache.invalidate_many([heap_node.ride.ride_num for heap_node, _, _ in updates] +
+                                        [heap_node.ride.ride_num for heap_node in removals])
+
+
+# Number of pieces an OutputSink buffers for a single line before handing them to the stream
+MAX_BUFFERED_CHUNKS = 65536
+
+
+class OutputSink:
+    def __init__(self, target="output_file.txt", mode="w", flush_every=0, flush_on_next_ride=False):
+        """
+        Create a buffered destination for the lines produced by the ride commands.
+
+        Parameters:
+        target (str or file object): Path of the output file, "-" for stdout, or any object with a write() method
+            (an open file, a pipe, an io.StringIO, ...).
+        mode (str): The mode used to open target when it is a path ("w" truncates, "a" appends).
+        flush_every (int): Write the buffer out after this many lines; 0 only flushes on close.
+        flush_on_next_ride (bool): Write the buffer out after every GetNextRide result.
+        """
+        if isinstance(target, str):
+            if target == "-":
+                self.file = sys.stdout
+                self.owns_file = False
             else:
-                # If the ride is a list, convert the list of rides to a string
-                if len(ride) == 0:
-                    message = "(0,0,0)\n"
-                else:
-                    rides_str = ",".join(f"({r.ride_num},{r.cost_ride},{r.triptime})" for r in ride)
-                    message = f"{rides_str}\n"
-            # Write the message to the output file
-            file.write(message)
-            
-            
+                # The file is opened exactly once and kept for the whole run
+                self.file = open(target, mode)
+                self.owns_file = True
+        else:
+            self.file = target
+            self.owns_file = False
+
+        self.buffer = []
+        self.lines = 0
+        self.flush_every = flush_every
+        self.flush_on_next_ride = flush_on_next_ride
+
+    def write(self, line):
+        # Queue the line and only touch the file when the flush policy asks for it
+        self.buffer.append(line)
+        self.lines += 1
+        if self.flush_every and self.lines >= self.flush_every:
+            self.flush()
+
+    def write_message(self, message):
+        self.write(message + "\n")
+
+    def write_repeated(self, message, count):
+        # Write count copies of the message line, handing a long run to the stream in chunks of bounded size
+        line = message + "\n"
+        while count > 0:
+            run = min(count, MAX_BUFFERED_CHUNKS)
+            self.write(line * run)
+            count -= run
+            if count > 0:
+                self.drain()
+
+    def write_ride(self, ride):
+        self.write(f"({ride.ride_num},{ride.cost_ride},{ride.triptime})\n")
+
+    def write_rides(self, rides):
+        # Stream the rides (any iterable) onto one line without building the whole line first
+        buffer = self.buffer
+        separator = ""
+        for r in rides:
+            buffer.append(f"{separator}({r.ride_num},{r.cost_ride},{r.triptime})")
+            separator = ","
+            # Very wide ranges are handed to the stream in chunks so the buffer stays bounded
+            if len(buffer) >= MAX_BUFFERED_CHUNKS:
+                self.drain()
+
+        # An empty range is reported as a dummy ride
+        if separator == "":
+            buffer.append("(0,0,0)")
+        self.write("\n")
+
+    def drain(self):
+        # Hand everything buffered so far to the underlying stream in a single write
+        if self.buffer:
+            self.file.write("".join(self.buffer))
+            self.buffer.clear()
+
+    def flush(self):
+        self.drain()
+        self.lines = 0
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        # Streams passed in by the caller stay open, only files opened here are closed
+        if self.owns_file:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def write_to_output(ride, message, is_list, sink=None):
+    # Without a sink, fall back to appending to output_file.txt for this single result
+    if sink is None:
+        with OutputSink("output_file.txt", "a") as file_sink:
+            write_to_output(ride, message, is_list, file_sink)
+        return
+
+    # If the ride is None, write the message to the output
+    if ride is None:
+        sink.write_message(message)
+    # If the ride is a list, write all of the rides on one line
+    elif is_list:
+        sink.write_rides(ride)
+    # Otherwise write the single ride information
+    else:
+        sink.write_ride(ride)
+
+
+class GatorTaxi:
+    def __init__(self, sink=None, heap="binary", exit_on_duplicate=True, max_dead_fraction=None, index="rbt",
+                 range_cache=0):
+        """
+        Create a dispatcher that owns one Min Heap / Red-Black Tree pair.
+
+        Parameters:
+        sink (OutputSink): Where the command results are written. None appends to output_file.txt per result.
+        heap (str): The priority queue backend, one of HEAP_BACKENDS.
+        exit_on_duplicate (bool): Stop the program at a duplicate Insert, as a batch run does; when False
+            the duplicate is only reported and the dispatcher keeps running.
+        max_dead_fraction (float): Cancel rides lazily, see LazyDeleteHeap: a cancelled ride leaves the tree
+            at once but stays in the heap as a tombstone until this fraction of the heap is dead. None removes
+            it from the heap at once.
+        index (str): The ordered index of the rides by ride_num, one of INDEX_BACKENDS.
+        range_cache (int): Keep the formatted results of up to this many Print(low, high) ranges in a
+            RangeCache until one of their rides changes; 0 formats every Print again.
+        """
+        self.heap = HEAP_BACKENDS[heap]()
+        if max_dead_fraction is not None:
+            self.heap = LazyDeleteHeap(self.heap, max_dead_fraction)
+        self.rbt = INDEX_BACKENDS[index]()
+        if range_cache:
+            self.rbt.range_cache = RangeCache(range_cache)
+        self.sink = sink
+        self.exit_on_duplicate = exit_on_duplicate
+
+        # Dispatch table indexed by opcode, built once so every command is a single list lookup
+        self.handlers = [None] * len(OPCODE_NAMES)
+        self.handlers[OP_INSERT] = self.insert
+        self.handlers[OP_PRINT] = self.print_ride
+        self.handlers[OP_PRINT_RANGE] = self.print_rides
+        self.handlers[OP_UPDATE_TRIP] = self.update_trip
+        self.handlers[OP_GET_NEXT_RIDE] = self.get_next_ride
+        self.handlers[OP_CANCEL_RIDE] = self.cancel_ride
+        self.handlers[OP_COUNT_RIDES] = self.count_rides
+        self.handlers[OP_PEEK_NEXT_RIDE] = self.peek_next_ride
+        self.handlers[OP_TOP_RIDES] = self.top_rides
+        self.handlers[OP_GET_NEXT_RIDES] = self.get_next_rides
+        self.handlers[OP_PRINT_BY_COST] = self.print_by_cost
+        self.handlers[OP_REPRICE] = self.reprice
+
+    def insert(self, ride_num, cost_ride, triptime):
+        insert_ride(Ride(ride_num, cost_ride, triptime), self.heap, self.rbt, self.sink, self.exit_on_duplicate)
+
+    def insert_many(self, rides_details):
+        # Insert a run of (ride_num, cost_ride, triptime) tuples, long runs go through the bulk-load path
+        if len(rides_details) < BULK_INSERT_MIN_RUN:
+            insert = self.handlers[OP_INSERT]
+            for details in rides_details:
+                insert(*details)
+        else:
+            bulk_insert([Ride(*details) for details in rides_details], self.heap, self.rbt, self.sink,
+                        self.exit_on_duplicate)
+
+    def load_rides(self, rides_details):
+        """
+        Load (ride_num, cost_ride, triptime) tuples into the dispatcher, e.g. when restoring a snapshot.
+        Goes through bulk_insert, so rides given in ride_num order are linked into the tree in linear time.
+        """
+        bulk_insert([Ride(*details) for details in rides_details], self.heap, self.rbt, self.sink)
+
+    def iter_rides(self):
+        # Every active ride in ascending order of ride_num
+        return self.rbt.iter_range(float("-inf"), float("inf"))
+
+    def print_ride(self, ride_num):
+        print_ride(ride_num, self.rbt, self.sink)
+
+    def print_rides(self, lower_bound, upper_bound):
+        print_rides(lower_bound, upper_bound, self.rbt, self.sink)
+
+    def page_rides(self, lower_bound, upper_bound, limit, cursor=None):
+        # One page of rides in [lower_bound, upper_bound] and the cursor for the next page (None at the end)
+        return self.rbt.page_range(lower_bound, upper_bound, limit, cursor)
 
-def main():
+    def update_trip(self, ride_num, new_duration):
+        update_ride(ride_num, new_duration, self.heap, self.rbt, self.sink)
 
-    if len(sys.argv) < 2:
+    def update_many(self, updates):
+        # Apply a batch of (ride_num, new_duration) tuples in order, long batches go through update_rides
+        if len(updates) < BULK_UPDATE_MIN_RUN:
+            update_trip = self.handlers[OP_UPDATE_TRIP]
+            for ride_num, new_duration in updates:
+                update_trip(ride_num, new_duration)
+        else:
+            ride_nums, new_durations = zip(*updates)
+            update_rides(ride_nums, new_durations, self.heap, self.rbt)
+
+    def get_next_ride(self):
+        return get_next_ride(self.heap, self.rbt, self.sink)
+
+    def get_next_rides(self, count):
+        return get_next_rides(count, self.heap, self.rbt, self.sink)
+
+    def cancel_ride(self, ride_num):
+        cancel_ride(ride_num, self.heap, self.rbt)
+
+    def count_rides(self, lower_bound, upper_bound):
+        count_rides(lower_bound, upper_bound, self.rbt, self.sink)
+
+    def peek_next_ride(self):
+        peek_next_ride(self.heap, self.sink)
+
+    def print_by_cost(self, low, high):
+        print_by_cost(low, high, self.rbt, self.sink)
+
+    def reprice(self, low, high, delta):
+        reprice_rides(low, high, delta, self.heap, self.rbt)
+
+    def top_rides(self, k):
+        top_rides(k, self.heap, self.sink)
+
+    def execute(self, opcode, args):
+        # Run a single already parsed command
+        self.handlers[opcode](*args)
+
+    def submit(self, line):
+        # Parse and run a single command line, e.g. engine.submit("Insert(1,10,20)")
+        command = parse_command(line)
+        if command is not None:
+            self.execute(*command)
+
+    def run(self, commands):
+        # Run a stream of (opcode, args) tuples
+        handlers = self.handlers
+        pending_inserts = []
+        for opcode, args in commands:
+            # Consecutive Inserts are collected and loaded together once the run ends
+            if opcode == OP_INSERT:
+                pending_inserts.append(args)
+                continue
+            if pending_inserts:
+                self.insert_many(pending_inserts)
+                pending_inserts = []
+            handlers[opcode](*args)
+
+        if pending_inserts:
+            self.insert_many(pending_inserts)
+
+    def run_lines(self, lines):
+        # Parse and run a stream of command lines
+        self.run(iter_commands(lines))
+
+
+class DurableGatorTaxi(GatorTaxi):
+    def __init__(self, sink=None, heap="binary", path_prefix="gator_taxi", sync_every=1024, sync_interval=0.05,
+                 compact_every=100000, exit_on_duplicate=True, max_dead_fraction=None, index="rbt", range_cache=0):
+        """
+        A GatorTaxi whose Insert, UpdateTrip, CancelRide and GetNextRide mutations survive a crash.
+
+        Every mutation is appended to a write-ahead log (<path_prefix>.wal) with group commit, and every
+        compact_every records the whole state is written to a snapshot (<path_prefix>.snap) and the log is
+        emptied. Creating the dispatcher recovers the previous state: the snapshot is loaded and the log
+        records after it are replayed.
+
+        Parameters:
+        sync_every (int), sync_interval (float): Group commit policy, see persistence.WriteAheadLog.
+        compact_every (int): Number of log records between two compactions.
+        """
+        super().__init__(sink, heap, exit_on_duplicate, max_dead_fraction, index, range_cache)
+        self.snapshot_path = path_prefix + ".snap"
+        self.wal_path = path_prefix + ".wal"
+        self.compact_every = compact_every
+
+        lsn = self.recover()
+        self.wal = persistence.WriteAheadLog(self.wal_path, lsn, sync_every, sync_interval)
+        self.next_compaction = lsn + compact_every
+
+    def recover(self):
+        # Load the snapshot and replay the log records written after it; returns the last sequence number
+        lsn = 0
+        if os.path.exists(self.snapshot_path):
+            persistence.load_snapshot(self.snapshot_path, self)
+            lsn = persistence.snapshot_lsn(self.snapshot_path)
+
+        # Replay works on the heap and tree directly, so it never writes any output
+        for lsn, opcode, first, second, third in persistence.read_wal(self.wal_path, lsn):
+            if opcode == OP_INSERT:
+                # A logged Insert may have been rejected as a duplicate when it ran
+                if self.rbt.get_ride(first) is None:
+                    insert_ride(Ride(first, second, third), self.heap, self.rbt)
+            elif opcode == OP_UPDATE_TRIP:
+                if self.rbt.get_ride(first) is not None:
+                    update_ride(first, second, self.heap, self.rbt)
+            elif opcode == OP_CANCEL_RIDE:
+                cancel_ride(first, self.heap, self.rbt)
+            elif opcode == OP_REPRICE:
+                reprice_rides(first, second, third, self.heap, self.rbt)
+        return lsn
+
+    def compact(self):
+        # Write the current state to the snapshot, then empty the log it now covers
+        self.wal.sync()
+        persistence.save_snapshot(self.snapshot_path, self, self.wal.lsn)
+        self.wal.reset()
+        self.next_compaction = self.wal.lsn + self.compact_every
+
+    def insert(self, ride_num, cost_ride, triptime):
+        # Mutations are logged before they are applied
+        self.wal.append(OP_INSERT, ride_num, cost_ride, triptime)
+        super().insert(ride_num, cost_ride, triptime)
+        if self.wal.lsn >= self.next_compaction:
+            self.compact()
+
+    def insert_many(self, rides_details):
+        # A short run goes through insert, which logs every ride itself
+        if len(rides_details) >= BULK_INSERT_MIN_RUN:
+            logged = rides_details
+            if self.exit_on_duplicate:
+                # The run stops at its first duplicate: log the rides before it and the rejected Insert, as
+                # insert does, but nothing after it, since those rides are never applied
+                count = first_duplicate((details[0] for details in rides_details), self.rbt)
+                if count is not None:
+                    logged = rides_details[:count + 1]
+            for details in logged:
+                self.wal.append(OP_INSERT, *details)
+        super().insert_many(rides_details)
+        if self.wal.lsn >= self.next_compaction:
+            self.compact()
+
+    def update_trip(self, ride_num, new_duration):
+        self.wal.append(OP_UPDATE_TRIP, ride_num, new_duration)
+        super().update_trip(ride_num, new_duration)
+        if self.wal.lsn >= self.next_compaction:
+            self.compact()
+
+    def update_many(self, updates):
+        # A short run goes through update_trip, which logs every update itself
+        if len(updates) >= BULK_UPDATE_MIN_RUN:
+            for ride_num, new_duration in updates:
+                self.wal.append(OP_UPDATE_TRIP, ride_num, new_duration)
+        super().update_many(updates)
+        if self.wal.lsn >= self.next_compaction:
+            self.compact()
+
+    def cancel_ride(self, ride_num):
+        self.wal.append(OP_CANCEL_RIDE, ride_num)
+        super().cancel_ride(ride_num)
+        if self.wal.lsn >= self.next_compaction:
+            self.compact()
+
+    def reprice(self, low, high, delta):
+        self.wal.append(OP_REPRICE, low, high, delta)
+        super().reprice(low, high, delta)
+        if self.wal.lsn >= self.next_compaction:
+            self.compact()
+
+    def get_next_ride(self):
+        # Which ride is dispatched depends on the heap layout, so the outcome is logged as a cancellation
+        # of that ride rather than the command itself
+        ride = super().get_next_ride()
+        if ride is not None:
+            self.wal.append(OP_CANCEL_RIDE, ride.ride_num)
+            if self.wal.lsn >= self.next_compaction:
+                self.compact()
+        return ride
+
+    def get_next_rides(self, count):
+        rides = super().get_next_rides(count)
+        for ride in rides:
+            self.wal.append(OP_CANCEL_RIDE, ride.ride_num)
+        if self.wal.lsn >= self.next_compaction:
+            self.compact()
+        return rides
+
+    def close(self):
+        # Make every logged mutation durable
+        self.wal.close()
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="GatorTaxi ride dispatcher")
+    parser.add_argument("input_file", help="file containing the ride commands, - for stdin")
+    parser.add_argument("--output", default="output_file.txt",
+                        help="file the results are written to, '-' for stdout (default: output_file.txt)")
+    parser.add_argument("--flush-every", type=int, default=0, metavar="N",
+                        help="flush the output every N lines (default: only at the end of the run)")
+    parser.add_argument("--flush-on-next-ride", action="store_true",
+                        help="flush the output after every GetNextRide result")
+    parser.add_argument("--heap", choices=sorted(HEAP_BACKENDS), default="binary",
+                        help="priority queue backend (default: binary)")
+    parser.add_argument("--index", choices=sorted(INDEX_BACKENDS), default="rbt",
+                        help="ordered index of the rides by ride_num, a red-black tree or sorted blocks (default: rbt)")
+    parser.add_argument("--range-cache", type=int, default=0, metavar="N",
+                        help="cache the results of up to N Print(low, high) ranges until one of their rides changes "
+                             "(default: 0, no cache)")
+    parser.add_argument("--load-snapshot", metavar="PATH",
+                        help="restore the active rides from a snapshot file before running the commands")
+    parser.add_argument("--save-snapshot", metavar="PATH",
+                        help="write the active rides to a snapshot file after running the commands")
+    parser.add_argument("--wal", metavar="PREFIX",
+                        help="keep the rides durable in PREFIX.wal/PREFIX.snap and recover them on start")
+    parser.add_argument("--wal-sync-every", type=int, default=1024, metavar="N",
+                        help="fsync the log at least every N mutations (default: 1024)")
+    parser.add_argument("--wal-sync-interval", type=float, default=0.05, metavar="SECONDS",
+                        help="fsync the log at least every SECONDS seconds (default: 0.05)")
+    parser.add_argument("--compact-every", type=int, default=100000, metavar="N",
+                        help="compact the log into the snapshot every N mutations (default: 100000)")
+    parser.add_argument("--lazy-cancel", type=float, metavar="FRACTION",
+                        help="leave cancelled rides in the heap as tombstones and compact it once FRACTION of it is "
+                             "dead (default: remove them at once)")
+    parser.add_argument("--mmap", action="store_true",
+                        help="memory-map the input file and tokenize it in chunks instead of reading it line by line")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="collect per-command latencies and tree/heap counters and write them to PATH as JSON "
+                             "at the end of the run and on SIGUSR1")
+    args = parser.parse_args(argv)
+    if args.wal and args.load_snapshot:
+        parser.error("--load-snapshot cannot be combined with --wal, which restores its own snapshot")
+    if args.mmap and args.input_file == "-":
+        parser.error("--mmap needs an input file, stdin cannot be mapped")
+    return args
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+
+    if len(argv) < 1:
         print("Invalid Arguments")
         print("Enter Command of the form : python3 gator_taxi.py <input_file_name.txt>")
         return
 
+    args = parse_args(argv)
 
-    ride_heap = MinHeap()
-    ride_tree = RedBlackTree()
-
-    # Open input and output files
-    with open(sys.argv[1], "r") as input_file, open("output_file.txt", "w") as output_file:
-        # Iterate over each line in the input file
-        for line in input_file.readlines():
-            # Parse the ride details from the line
-            ride_details = []
-            ride_details = [int(num) for num in line[line.index("(") + 1:line.index(")")].split(",") if num != '']
-
-            # Determine the operation based on the line content and execute it
-            if "Insert" in line:
-                # Create a new ride object and insert it into the ride heap and tree
-                new_ride = Ride(ride_details[0], ride_details[1], ride_details[2])
-                insert_ride(new_ride, ride_heap, ride_tree)
-            elif "UpdateTrip" in line:
-                # Update the trip duration of an existing ride in the ride heap and tree
-                ride_index = ride_details[0]
-                new_duration = ride_details[1]
-                update_ride(ride_index, new_duration, ride_heap, ride_tree)
-            elif "GetNextRide" in line:
-                # Get the ride with the earliest start time from the ride heap and remove it from both the heap and tree
-                get_next_ride(ride_heap, ride_tree)
-            elif "CancelRide" in line:
-                # Cancel an existing ride by removing it from both the heap and tree
-                ride_index = ride_details[0]
-                cancel_ride(ride_index, ride_heap, ride_tree)
-            elif "Print" in line:
-                # Print either a single ride or a range of rides from the ride tree
-                if len(ride_details) == 1:
-                    ride_index = ride_details[0]
-                    print_ride(ride_index, ride_tree)
-                elif len(ride_details) == 2:
-                    start_index = ride_details[0]
-                    end_index = ride_details[1]
-                    print_rides(start_index, end_index, ride_tree)
-
-    # Close the output file
-    output_file.close()
+    # Open the input (- reads from stdin, --mmap maps the file itself) and the output sink (opened once for the run)
+    if args.mmap:
+        import ingest
+        input_file = None
+    else:
+        input_file = sys.stdin if args.input_file == "-" else open(args.input_file, "r")
+    try:
+        with OutputSink(args.output, "w", args.flush_every, args.flush_on_next_ride) as sink:
+            if args.wal:
+                engine = DurableGatorTaxi(sink, args.heap, args.wal, args.wal_sync_every, args.wal_sync_interval,
+                                          args.compact_every, max_dead_fraction=args.lazy_cancel, index=args.index,
+                                          range_cache=args.range_cache)
+            else:
+                engine = GatorTaxi(sink, args.heap, max_dead_fraction=args.lazy_cancel, index=args.index,
+                                   range_cache=args.range_cache)
+            if args.load_snapshot:
+                persistence.load_snapshot(args.load_snapshot, engine)
+
+            recorder = None
+            if args.metrics:
+                import metrics
+                recorder = metrics.DispatchMetrics(engine)
+                recorder.export_on_signal(args.metrics)
+
+            try:
+                # The input is streamed line by line or chunk by chunk, so memory stays flat regardless of its size
+                if args.mmap:
+                    engine.run(ingest.iter_mapped_commands(args.input_file))
+                else:
+                    engine.run_lines(input_file)
+            finally:
+                if args.wal:
+                    engine.close()
+                if recorder is not None:
+                    recorder.export(args.metrics)
+
+            if args.save_snapshot:
+                persistence.save_snapshot(args.save_snapshot, engine)
+    finally:
+        if input_file is not None and input_file is not sys.stdin:
+            input_file.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,94 @@
+import json
+import mmap
+import os
+import re
+from operator import itemgetter
+
+from commands import COMMANDS, MAX_GET_NEXT_RIDES, OP_GET_NEXT_RIDES, iter_commands
+
+# Bytes of the mapped file tokenized per chunk; a chunk is extended to the end of its last line
+CHUNK_BYTES = 1 << 16
+
+# (command name, 1 + number of arguments) -> opcode
+SHAPE_OPCODES = {(name, arity + 1): opcode for name, arities in COMMANDS.items() for arity, opcode in arities.items()}
+
+# A chunk made only of command lines in the strict form Name(int,int,...) with no blanks. Only such a chunk is
+# turned into JSON: the name is plain letters and the arguments plain integers, so no other text can be made up.
+STRICT_CHUNK = re.compile(rb"(?:[A-Za-z]+\((?:-?[0-9]+(?:,-?[0-9]+)*)?\)\n)*")
+
+
+def tokenize_chunk(chunk):
+    """
+    Tokenize a chunk of command lines with a few calls that each loop over the whole chunk in C: one regex
+    pass checks that every line is in the strict form, the lines are rewritten into a JSON array such as
+    [["Insert",5,50,120],["GetNextRide"]] and parsed at once, and the opcodes are looked up by name and length.
+
+    Returns (opcodes, commands), the list of opcodes and the list of the parsed [name, args...] lists, or None
+    when the chunk holds a line that is not in the strict form (a blank line, spaces, a malformed or unknown
+    command, a GetNextRides count out of range, ...) and has to go through parse_command line by line.
+    """
+    if b"\r" in chunk:
+        chunk = chunk.replace(b"\r\n", b"\n")
+    if not chunk.endswith(b"\n"):
+        chunk += b"\n"
+    if STRICT_CHUNK.fullmatch(chunk) is None:
+        return None
+
+    text = chunk.replace(b"()\n", b'"],["').replace(b"(", b'",').replace(b")\n", b'],["')
+    try:
+        # Cut the '["' the last line opened
+        commands = json.loads(b'[["' + text[:-3] + b"]")
+    except ValueError:
+        # e.g. a number with leading zeros
+        return None
+
+    opcodes = list(map(SHAPE_OPCODES.get, zip(map(itemgetter(0), commands), map(len, commands))))
+    if None in opcodes:
+        return None
+    # parse_command reports a GetNextRides count it does not accept
+    if OP_GET_NEXT_RIDES in opcodes and any(not 1 <= command[1] <= MAX_GET_NEXT_RIDES
+                                            for opcode, command in zip(opcodes, commands)
+                                            if opcode == OP_GET_NEXT_RIDES):
+        return None
+    return opcodes, commands
+
+
+def iter_mapped_commands(path, chunk_bytes=CHUNK_BYTES):
+    """
+    Lazily read the command file at path as (opcode, args) tuples, exactly like iter_commands, through a
+    read-only memory map instead of a str and a parse per line.
+
+    The file is tokenized one chunk at a time and the pages of a chunk are handed back to the kernel once
+    its commands have been consumed, so the memory used stays bounded by the chunk size however large the
+    file is.
+    """
+    with open(path, "rb") as command_file:
+        size = os.fstat(command_file.fileno()).st_size
+        # An empty file cannot be mapped
+        if size == 0:
+            return
+        with mmap.mmap(command_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if hasattr(mmap, "MADV_SEQUENTIAL"):
+                data.madvise(mmap.MADV_SEQUENTIAL)
+
+            pos = released = 0
+            while pos < size:
+                # Cut the chunk at the end of a line
+                end = data.find(b"\n", min(pos + chunk_bytes, size) - 1)
+                end = size if end == -1 else end + 1
+
+                chunk = data[pos:end]
+                tokens = tokenize_chunk(chunk)
+                if tokens is None:
+                    # Same commands and same errors, in the same order, as reading the file line by line
+                    yield from iter_commands(line.decode() for line in chunk.splitlines(True))
+                else:
+                    for opcode, command in zip(*tokens):
+                        yield opcode, tuple(command[1:])
+                pos = end
+
+                # The chunk's pages will not be read again
+                done = pos - pos % mmap.PAGESIZE
+                if done > released and hasattr(mmap, "MADV_DONTNEED"):
+                    data.madvise(mmap.MADV_DONTNEED, released, done - released)
+                    released = done
@@ -0,0 +1,225 @@
+import json
+import os
+import signal
+import time
+
+from commands import (BULK_INSERT_MIN_RUN, BULK_UPDATE_MIN_RUN, OP_CANCEL_RIDE, OP_COUNT_RIDES, OP_GET_NEXT_RIDE,
+                      OP_GET_NEXT_RIDES, OP_INSERT, OP_PEEK_NEXT_RIDE, OP_PRINT, OP_PRINT_BY_COST, OP_PRINT_RANGE,
+                      OP_REPRICE, OP_TOP_RIDES, OP_UPDATE_TRIP)
+
+# Engine method -> (opcode it handles, label in the report); None for the batch methods, which are not in the
+# dispatch table
+TIMED_METHODS = {
+    "insert": (OP_INSERT, "Insert"),
+    "print_ride": (OP_PRINT, "Print"),
+    "print_rides": (OP_PRINT_RANGE, "PrintRange"),
+    "update_trip": (OP_UPDATE_TRIP, "UpdateTrip"),
+    "get_next_ride": (OP_GET_NEXT_RIDE, "GetNextRide"),
+    "get_next_rides": (OP_GET_NEXT_RIDES, "GetNextRides"),
+    "cancel_ride": (OP_CANCEL_RIDE, "CancelRide"),
+    "count_rides": (OP_COUNT_RIDES, "CountRides"),
+    "peek_next_ride": (OP_PEEK_NEXT_RIDE, "PeekNextRide"),
+    "top_rides": (OP_TOP_RIDES, "TopRides"),
+    "print_by_cost": (OP_PRINT_BY_COST, "PrintByCost"),
+    "reprice": (OP_REPRICE, "Reprice"),
+    "insert_many": (None, "InsertBatch"),
+    "update_many": (None, "UpdateBatch"),
+}
+
+# Batch method -> (shortest run it handles as a batch, counter of the commands run in batches); shorter runs go
+# through the single command handler, which is timed on its own
+BATCH_RUNS = {"insert_many": (BULK_INSERT_MIN_RUN, "bulk_inserted_rides"),
+              "update_many": (BULK_UPDATE_MIN_RUN, "bulk_updated_rides")}
+
+# Latency histograms have one bucket per power of two nanoseconds
+HISTOGRAM_BUCKETS = 64
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.count = 0
+        self.total_ns = 0
+        # buckets[k] counts the durations d with 2^(k-1) <= d < 2^k nanoseconds
+        self.buckets = [0] * HISTOGRAM_BUCKETS
+
+    def record(self, duration_ns):
+        self.count += 1
+        self.total_ns += duration_ns
+        self.buckets[min(duration_ns.bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+
+    def percentile(self, fraction):
+        # Upper bound of the bucket holding the given fraction of the samples, in nanoseconds
+        rank = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return 1 << bucket
+        return 0
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total_us": self.total_ns / 1000,
+            "mean_us": self.total_ns / self.count / 1000 if self.count else 0,
+            "p50_us_max": self.percentile(0.50) / 1000,
+            "p99_us_max": self.percentile(0.99) / 1000,
+            # Only the non-empty buckets, keyed by their upper bound
+            "buckets_ns": {f"<{1 << bucket}": count for bucket, count in enumerate(self.buckets) if count},
+        }
+
+
+def tree_height(rbt):
+    # Number of nodes on the longest root-to-leaf path, walked with an explicit stack
+    height = 0
+    stack = [(rbt.root, 1)] if rbt.root is not rbt.null_node else []
+    while stack:
+        node, depth = stack.pop()
+        height = max(height, depth)
+        for child in (node.left, node.right):
+            if child is not rbt.null_node:
+                stack.append((child, depth + 1))
+    return height
+
+
+def delete_fix_iterations(rbt, node):
+    """
+    Number of loop iterations RedBlackTree.post_delete_fix(node) is about to run, read from the tree before
+    the call: the loop climbs one level per black sibling with two black children and stops at the first
+    iteration that rotates around a red sibling or a sibling with a red child.
+    """
+    iterations = 0
+    while node is not rbt.root and node.color == 0:
+        iterations += 1
+        sibling = node.pp.left if node is node.pp.right else node.pp.right
+        if sibling.color != 0 or sibling.left.color != 0 or sibling.right.color != 0:
+            break
+        node = node.pp
+    return iterations
+
+
+class DispatchMetrics:
+    def __init__(self, engine):
+        """
+        Opt-in instrumentation of one GatorTaxi: a latency histogram per command type and counters for the
+        rotations, heap swaps (pairing heap: melds) and post_delete_fix iterations.
+
+        The counters are installed by replacing the engine's handlers and the methods of its heap and tree
+        with counting wrappers on those instances only, so a dispatcher that is not instrumented runs the
+        original code with no extra work at all.
+
+        Parameters:
+        engine (GatorTaxi): The dispatcher to instrument, before it runs any command.
+        """
+        self.engine = engine
+        self.histograms = {label: LatencyHistogram() for _, label in TIMED_METHODS.values()}
+        self.counters = {"left_rotations": 0, "right_rotations": 0, "heap_swaps": 0, "heap_melds": 0,
+                         "post_delete_fix_calls": 0, "post_delete_fix_iterations": 0, "bulk_inserted_rides": 0,
+                         "bulk_updated_rides": 0}
+        self.started = time.perf_counter()
+        # A signal that arrives while a command runs is answered once the command is done
+        self.running = False
+        self.pending_export = None
+
+        for name, (opcode, label) in TIMED_METHODS.items():
+            timed = self.timed_batch(getattr(engine, name), label, *BATCH_RUNS[name]) if opcode is None else \
+                self.timed(getattr(engine, name), self.histograms[label])
+            setattr(engine, name, timed)
+            if opcode is not None:
+                engine.handlers[opcode] = timed
+
+        # A LazyDeleteHeap counts the swaps and melds of the heap it wraps
+        rbt, heap = engine.rbt, getattr(engine.heap, "inner", engine.heap)
+        # A SortedBlockIndex has no rotations or fix-ups to count
+        if hasattr(rbt, "post_delete_fix"):
+            rbt.leftro = self.counted(rbt.leftro, "left_rotations")
+            rbt.rightro = self.counted(rbt.rightro, "right_rotations")
+            rbt.post_delete_fix = self.counted_delete_fix(rbt, rbt.post_delete_fix)
+        if hasattr(heap, "swap"):
+            heap.swap = self.counted(heap.swap, "heap_swaps")
+        if hasattr(heap, "meld"):
+            heap.meld = self.counted(heap.meld, "heap_melds")
+
+    def timed(self, method, histogram):
+        clock = time.perf_counter_ns
+
+        def wrapper(*args):
+            self.running = True
+            begin = clock()
+            try:
+                return method(*args)
+            finally:
+                histogram.record(clock() - begin)
+                self.running = False
+                if self.pending_export is not None:
+                    self.export(self.pending_export)
+        return wrapper
+
+    def timed_batch(self, method, label, min_run, counter):
+        # Short runs go through the (timed) single command handler one at a time; only the batches are timed here
+        histogram = self.timed(method, self.histograms[label])
+
+        def wrapper(batch):
+            if len(batch) < min_run:
+                return method(batch)
+            self.counters[counter] += len(batch)
+            return histogram(batch)
+        return wrapper
+
+    def counted(self, method, counter):
+        counters = self.counters
+
+        def wrapper(*args):
+            counters[counter] += 1
+            return method(*args)
+        return wrapper
+
+    def counted_delete_fix(self, rbt, method):
+        counters = self.counters
+
+        def wrapper(node):
+            counters["post_delete_fix_calls"] += 1
+            counters["post_delete_fix_iterations"] += delete_fix_iterations(rbt, node)
+            return method(node)
+        return wrapper
+
+    def snapshot(self):
+        # Everything collected so far, plus the current shape of the heap and the tree
+        snapshot = {
+            "elapsed_seconds": time.perf_counter() - self.started,
+            "commands": {label: histogram.to_dict() for label, histogram in self.histograms.items()
+                         if histogram.count},
+            "counters": dict(self.counters),
+            "heap_size": self.engine.heap.curr_size,
+            # Cancelled rides still waiting in a LazyDeleteHeap
+            "heap_tombstones": len(getattr(self.engine.heap, "dead", ())),
+        }
+        if hasattr(self.engine.rbt, "root"):
+            snapshot["tree_height"] = tree_height(self.engine.rbt)
+        else:
+            snapshot["index_blocks"] = len(self.engine.rbt.blocks)
+        if self.engine.rbt.range_cache is not None:
+            snapshot["range_cache"] = self.engine.rbt.range_cache.stats()
+        return snapshot
+
+    def export(self, path):
+        # Write the snapshot as JSON, through a temporary file so a reader never sees half of it
+        self.pending_export = None
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as metrics_file:
+            json.dump(self.snapshot(), metrics_file, indent=2)
+            metrics_file.write("\n")
+        os.replace(temp_path, path)
+
+    def export_on_signal(self, path, signum=getattr(signal, "SIGUSR1", None)):
+        # e.g. kill -USR1 <pid> writes the metrics collected so far to path without stopping the run
+        if signum is None:
+            return
+
+        def handler(signum, frame):
+            # The tree may be halfway through a rotation while a command runs, so wait for it to finish
+            if self.running:
+                self.pending_export = path
+            else:
+                self.export(path)
+        signal.signal(signum, handler)
@@ -0,0 +1,168 @@
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+
+# Snapshot file layout: a header (magic, number of rides, sequence number of the last logged mutation it
+# contains) followed by one little-endian (ride_num, cost_ride, triptime) int64 triple per active ride,
+# in ascending order of ride_num
+SNAPSHOT_MAGIC = b"GTSNAP02"
+SNAPSHOT_HEADER = struct.Struct("<8sqq")
+
+# Write-ahead log layout: fixed size records of (sequence number, opcode, three int64 arguments)
+WAL_RECORD = struct.Struct("<qBqqq")
+
+
+def save_snapshot(path, engine, lsn=0):
+    """
+    Write every active ride of a GatorTaxi dispatcher to a binary snapshot file.
+    lsn is the sequence number of the last write-ahead log record already reflected in the rides.
+
+    The file is written next to path and renamed over it, so a crash never leaves a half written snapshot.
+    """
+    values = array("q")
+    count = 0
+    for ride in engine.iter_rides():
+        values.append(ride.ride_num)
+        values.append(ride.cost_ride)
+        values.append(ride.triptime)
+        count += 1
+
+    # The snapshot is always little-endian, whatever the machine writing it
+    if sys.byteorder != "little":
+        values.byteswap()
+
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as file:
+        file.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, count, lsn))
+        values.tofile(file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+    return count
+
+
+def load_snapshot(path, engine):
+    """
+    Restore the rides of a snapshot file into an empty GatorTaxi dispatcher and return how many were loaded.
+
+    The file is memory-mapped and the ride columns are read straight out of the mapping, without parsing.
+    Because the rides are stored in ride_num order, the tree is rebuilt in linear time and the heap heapified.
+    """
+    with open(path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        if size < SNAPSHOT_HEADER.size:
+            raise ValueError(f"{path} is not a GatorTaxi snapshot")
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            magic, count, _ = SNAPSHOT_HEADER.unpack_from(mapped, 0)
+            if magic != SNAPSHOT_MAGIC or size != SNAPSHOT_HEADER.size + count * 24:
+                raise ValueError(f"{path} is not a GatorTaxi snapshot")
+
+            view = memoryview(mapped)
+            try:
+                if sys.byteorder == "little":
+                    values = view[SNAPSHOT_HEADER.size:].cast("q")
+                else:
+                    # Big-endian machines need a byte-swapped copy
+                    values = array("q", view[SNAPSHOT_HEADER.size:])
+                    values.byteswap()
+
+                # Columns of ride_num, cost_ride and triptime, zipped back into one tuple per ride
+                engine.load_rides(zip(values[0::3], values[1::3], values[2::3]))
+            finally:
+                # Release every view of the mapping before it is closed
+                if isinstance(values, memoryview):
+                    values.release()
+                view.release()
+
+    return count
+
+
+def snapshot_lsn(path):
+    # Sequence number of the last write-ahead log record contained in a snapshot file
+    with open(path, "rb") as file:
+        magic, _, lsn = SNAPSHOT_HEADER.unpack(file.read(SNAPSHOT_HEADER.size))
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError(f"{path} is not a GatorTaxi snapshot")
+    return lsn
+
+
+class WriteAheadLog:
+    def __init__(self, path, lsn=0, sync_every=1024, sync_interval=0.05):
+        """
+        Append-only log of the mutations applied to a dispatcher, with group commit.
+
+        Records are buffered in memory and written and fsync'ed together once sync_every records are
+        pending or sync_interval seconds have passed since the last sync, so the cost of an fsync is shared
+        by a whole batch of commands.
+
+        Parameters:
+        path (str): The log file, created if missing. A torn record left at its end by a crash is cut off.
+        lsn (int): Sequence number of the last record already applied; new records continue from it.
+        sync_every (int): Maximum number of records waiting for a sync.
+        sync_interval (float): Maximum number of seconds a record waits for a sync.
+        """
+        self.path = path
+        self.lsn = lsn
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+
+        # Drop a partially written last record, so new records start on a record boundary
+        if os.path.exists(path):
+            size = os.path.getsize(path)
+            if size % WAL_RECORD.size:
+                os.truncate(path, size - size % WAL_RECORD.size)
+
+        self.file = open(path, "ab")
+        self.pending = bytearray()
+        self.pending_records = 0
+        self.last_sync = time.monotonic()
+
+    def append(self, opcode, first=0, second=0, third=0):
+        # Queue one record and sync if the group commit batch is full or old enough
+        self.lsn += 1
+        self.pending += WAL_RECORD.pack(self.lsn, opcode, first, second, third)
+        self.pending_records += 1
+        if self.pending_records >= self.sync_every or time.monotonic() - self.last_sync >= self.sync_interval:
+            self.sync()
+
+    def sync(self):
+        # Write the pending records and make them durable with a single fsync
+        if self.pending:
+            self.file.write(self.pending)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.pending.clear()
+            self.pending_records = 0
+        self.last_sync = time.monotonic()
+
+    def reset(self):
+        # Empty the log once a snapshot holds everything in it (sequence numbers keep increasing)
+        self.sync()
+        self.file.close()
+        self.file = open(self.path, "wb")
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.sync()
+        self.file.close()
+
+
+def read_wal(path, after_lsn=0):
+    """
+    Yield the (lsn, opcode, first, second, third) records of a write-ahead log with a sequence number greater
+    than after_lsn, in the order they were written. A torn record at the end of the file is ignored.
+    """
+    if not os.path.exists(path):
+        return
+
+    # The log is bounded by compaction, so it is read in one go
+    with open(path, "rb") as file:
+        data = file.read()
+    complete = len(data) - len(data) % WAL_RECORD.size
+    for record in WAL_RECORD.iter_unpack(memoryview(data)[:complete]):
+        if record[0] > after_lsn:
+            yield record
@@ -0,0 +1,232 @@
+import argparse
+import asyncio
+import contextlib
+import os
+import random
+import time
+
+from gator_taxi import HEAP_BACKENDS, GatorTaxi, OutputSink, parse_command
+
+
+class TransportWriter:
+    # File-like adapter so that an OutputSink writes its buffered lines straight to a connection
+    def __init__(self, transport):
+        self.transport = transport
+
+    def write(self, text):
+        self.transport.write(text.encode())
+
+    def flush(self):
+        pass
+
+
+class DispatchServer:
+    def __init__(self, engine):
+        """
+        Serve one GatorTaxi dispatcher to any number of connections.
+
+        Lines received during one iteration of the event loop are queued and executed together in a single
+        callback, and each connection gets all of the results of its commands in one write.
+
+        Parameters:
+        engine (GatorTaxi): The dispatcher, created with exit_on_duplicate=False so a duplicate Insert from one
+            client does not stop the server.
+        """
+        self.engine = engine
+        self.pending = []
+        self.scheduled = False
+        # UpdateTrip on an unknown ride prints an empty line to stdout, which is only noise for a server
+        self.null_output = open(os.devnull, "w")
+
+    def submit(self, connection, lines):
+        # Queue the lines and make sure the batch is processed once the loop has read every ready socket
+        self.pending.append((connection, lines))
+        if not self.scheduled:
+            self.scheduled = True
+            asyncio.get_running_loop().call_soon(self.process)
+
+    def process(self):
+        batch = self.pending
+        self.pending = []
+        self.scheduled = False
+
+        engine = self.engine
+        touched = {}
+        try:
+            with contextlib.redirect_stdout(self.null_output):
+                for connection, lines in batch:
+                    if connection.closed:
+                        continue
+                    # Results of these commands go to the connection that sent them
+                    engine.sink = connection.sink
+                    touched[connection] = True
+                    try:
+                        self.run_lines(lines)
+                    except Exception as error:
+                        # A command that fails in the engine is reported to its client, and the other
+                        # connections of the batch are still served
+                        connection.sink.write_message(f"Error: {error}")
+        finally:
+            engine.sink = None
+            # One write per connection for the whole batch
+            for connection in touched:
+                connection.sink.flush()
+
+    def run_lines(self, lines):
+        # Parse and run the lines of one connection, reporting a line that does not parse in order
+        engine = self.engine
+        commands = []
+        for line in lines:
+            try:
+                command = parse_command(line.decode())
+            except (ValueError, UnicodeDecodeError) as error:
+                # Run what came before the bad line, so the error is reported in order
+                engine.run(commands)
+                commands = []
+                engine.sink.write_message(f"Error: {error}")
+                continue
+            if command is not None:
+                commands.append(command)
+        engine.run(commands)
+
+    def close(self):
+        self.null_output.close()
+
+
+class DispatchProtocol(asyncio.Protocol):
+    def __init__(self, server):
+        self.server = server
+        self.partial = b""
+        self.closed = False
+        self.transport = None
+        self.sink = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.sink = OutputSink(TransportWriter(transport))
+
+    def data_received(self, data):
+        # Split the stream into complete lines, keeping an unfinished last line for the next read
+        lines = (self.partial + data).split(b"\n")
+        self.partial = lines.pop()
+        if lines:
+            self.server.submit(self, lines)
+
+    def connection_lost(self, exc):
+        self.closed = True
+
+
+async def serve(host, port, unix_path, heap):
+    server = DispatchServer(GatorTaxi(heap=heap, exit_on_duplicate=False))
+    loop = asyncio.get_running_loop()
+    if unix_path:
+        listener = await loop.create_unix_server(lambda: DispatchProtocol(server), unix_path)
+        print(f"GatorTaxi dispatcher listening on {unix_path}")
+    else:
+        listener = await loop.create_server(lambda: DispatchProtocol(server), host, port)
+        print(f"GatorTaxi dispatcher listening on {host}:{port}")
+
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.close()
+
+
+def client_commands(client_id, count, seed):
+    """
+    Command lines for one load generator client, and how many response lines they produce.
+
+    Every client inserts its own ride_nums, so no Insert is a duplicate and only Print and GetNextRide
+    answer with a line.
+    """
+    rng = random.Random(seed * 1000003 + client_id)
+    base = client_id * 10 ** 9
+    next_ride_num = base
+    lines = []
+    responses = []
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.4 or next_ride_num == base:
+            next_ride_num += 1
+            lines.append(f"Insert({next_ride_num},{rng.randint(1, 1000)},{rng.randint(1, 1000)})\n")
+            responses.append(0)
+        elif kind < 0.55:
+            ride_num = rng.randint(base + 1, next_ride_num)
+            lines.append(f"UpdateTrip({ride_num},{rng.randint(1, 1500)})\n")
+            responses.append(0)
+        elif kind < 0.65:
+            lines.append(f"CancelRide({rng.randint(base + 1, next_ride_num)})\n")
+            responses.append(0)
+        elif kind < 0.8:
+            lines.append("GetNextRide()\n")
+            responses.append(1)
+        elif kind < 0.9:
+            lines.append(f"Print({rng.randint(base + 1, next_ride_num)})\n")
+            responses.append(1)
+        else:
+            low = rng.randint(base + 1, next_ride_num)
+            lines.append(f"Print({low},{low + 20})\n")
+            responses.append(1)
+    return lines, responses
+
+
+async def run_client(client_id, count, pipeline, seed, host, port, unix_path):
+    # Send the commands in windows of pipeline lines and wait for the answers to each window
+    lines, responses = client_commands(client_id, count, seed)
+    if unix_path:
+        reader, writer = await asyncio.open_unix_connection(unix_path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+
+    for start in range(0, count, pipeline):
+        writer.write("".join(lines[start:start + pipeline]).encode())
+        for _ in range(sum(responses[start:start + pipeline])):
+            await reader.readline()
+
+    writer.close()
+    await writer.wait_closed()
+
+
+async def load_generator(clients, count, pipeline, seed, host, port, unix_path):
+    start = time.perf_counter()
+    await asyncio.gather(*(run_client(client_id, count, pipeline, seed, host, port, unix_path)
+                           for client_id in range(1, clients + 1)))
+    elapsed = time.perf_counter() - start
+    total = clients * count
+    print(f"{clients} clients, {total} commands in {elapsed:.2f}s: {total / elapsed:,.0f} ops/sec")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GatorTaxi dispatcher server and load generator")
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+
+    for name, help_text in (("serve", "run the dispatcher server"), ("loadgen", "benchmark a running server")):
+        subparser = subparsers.add_parser(name, help=help_text)
+        subparser.add_argument("--host", default="127.0.0.1")
+        subparser.add_argument("--port", type=int, default=7878)
+        subparser.add_argument("--unix", metavar="PATH", help="use a Unix socket instead of TCP")
+
+    serve_parser = subparsers.choices["serve"]
+    serve_parser.add_argument("--heap", choices=sorted(HEAP_BACKENDS), default="binary",
+                              help="priority queue backend (default: binary)")
+
+    loadgen_parser = subparsers.choices["loadgen"]
+    loadgen_parser.add_argument("--clients", type=int, default=8, help="concurrent connections")
+    loadgen_parser.add_argument("--commands", type=int, default=20000, help="commands sent by each client")
+    loadgen_parser.add_argument("--pipeline", type=int, default=256, help="commands in flight per client")
+    loadgen_parser.add_argument("--seed", type=int, default=1)
+
+    args = parser.parse_args()
+    try:
+        if args.mode == "serve":
+            asyncio.run(serve(args.host, args.port, args.unix, args.heap))
+        else:
+            asyncio.run(load_generator(args.clients, args.commands, args.pipeline, args.seed,
+                                       args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+import argparse
+import bisect
+import heapq
+import io
+import itertools
+import multiprocessing
+import sys
+
+from gator_taxi import (HEAP_BACKENDS, OP_CANCEL_RIDE, OP_COUNT_RIDES, OP_GET_NEXT_RIDE, OP_GET_NEXT_RIDES,
+                        OP_INSERT, OP_PEEK_NEXT_RIDE, OP_PRINT, OP_PRINT_BY_COST, OP_PRINT_RANGE, OP_REPRICE,
+                        OP_TOP_RIDES, OP_UPDATE_TRIP, GatorTaxi, OutputSink, cost_index, get_next_rides,
+                        iter_commands)
+
+# Shard-only opcode: the rides of one shard inside [low, high], formatted without the line break,
+# so the coordinator can join the pieces of several shards into one Print(low, high) line
+OP_RANGE_PIECE = -1
+# Shard-only opcode: the number of rides of one shard inside [low, high], summed up for CountRides(low, high)
+OP_COUNT_PIECE = -2
+# Shard-only opcode: the k cheapest rides of one shard as (key, formatted ride) pairs, merged for TopRides(k);
+# PeekNextRide is TopRides(1)
+OP_TOP_PIECE = -3
+# Shard-only opcode: dispatch the n cheapest rides of one shard and return them as (key, formatted ride) pairs,
+# merged for GetNextRides(count)
+OP_DISPATCH_PIECE = -4
+# Shard-only opcode: the rides of one shard with cost in [low, high] as (cost index key, formatted ride) pairs,
+# merged for PrintByCost(low, high)
+OP_COST_PIECE = -5
+
+# Number of queued commands after which the coordinator sends the batches to the shards
+MAX_PENDING_COMMANDS = 4096
+
+
+def heap_min_key(heap):
+    # (cost, triptime) of the cheapest ride in a shard's heap, or None if it is empty
+    node = heap.peek()
+    return None if node is None else node.key
+
+
+def shard_worker(connection, heap):
+    """
+    Body of a shard process: owns one GatorTaxi and executes the command batches sent by the coordinator.
+
+    Every batch is answered with the output of each command (an empty string for commands without output)
+    and the key of the shard's cheapest ride after the batch.
+    """
+    buffer = io.StringIO()
+    sink = OutputSink(buffer)
+    engine = GatorTaxi(sink, heap, exit_on_duplicate=False)
+    # Output of dispatches the coordinator formats itself
+    discard = OutputSink(io.StringIO())
+
+    while True:
+        batch = connection.recv()
+        if batch is None:
+            break
+
+        outputs = []
+        for opcode, args in batch:
+            if opcode == OP_RANGE_PIECE:
+                outputs.append(",".join(f"({r.ride_num},{r.cost_ride},{r.triptime})"
+                                        for r in engine.rbt.iter_range(*args)))
+                continue
+            if opcode == OP_COUNT_PIECE:
+                outputs.append(engine.rbt.count_range(*args))
+                continue
+            if opcode == OP_TOP_PIECE:
+                outputs.append([(node.key, f"({node.ride.ride_num},{node.ride.cost_ride},{node.ride.triptime})")
+                                for node in engine.heap.top_k(args[0])])
+                continue
+            if opcode == OP_COST_PIECE:
+                outputs.append([(node.key, f"({node.ride.ride_num},{node.ride.cost_ride},{node.ride.triptime})")
+                                for node in cost_index(engine.rbt).iter_cost_range(*args)])
+                continue
+            if opcode == OP_DISPATCH_PIECE:
+                # Popped rides keep their key, so the pieces can be merged in dispatch order
+                rides = get_next_rides(args[0], engine.heap, engine.rbt, discard)
+                discard.drain()
+                outputs.append([((r.cost_ride, r.triptime), f"({r.ride_num},{r.cost_ride},{r.triptime})")
+                                for r in rides])
+                continue
+
+            engine.execute(opcode, args)
+            # Collect whatever the command wrote
+            sink.drain()
+            outputs.append(buffer.getvalue())
+            buffer.seek(0)
+            buffer.truncate()
+
+        connection.send((outputs, heap_min_key(engine.heap)))
+
+    connection.close()
+
+
+class ShardedDispatcher:
+    def __init__(self, sink, bounds, heap="binary"):
+        """
+        Dispatcher that partitions the rides by ride_num range over one worker process per shard.
+
+        Parameters:
+        sink (OutputSink): Where the results are written, in the same format and order as GatorTaxi.
+        bounds (list of int): Sorted split points; shard i owns bounds[i-1] <= ride_num < bounds[i], so there
+            are len(bounds) + 1 shards.
+        heap (str): The priority queue backend of every shard, one of HEAP_BACKENDS.
+        """
+        self.sink = sink
+        self.bounds = list(bounds)
+        self.shard_count = len(self.bounds) + 1
+
+        self.connections = []
+        self.processes = []
+        for _ in range(self.shard_count):
+            parent_end, child_end = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=shard_worker, args=(child_end, heap), daemon=True)
+            process.start()
+            child_end.close()
+            self.connections.append(parent_end)
+            self.processes.append(process)
+
+        # Commands waiting to be sent to each shard
+        self.pending = [[] for _ in range(self.shard_count)]
+        self.pending_count = 0
+        # Output slots in command order: a list of (shard, index in its batch) per command; Print(low, high)
+        # and CountRides(low, high) have one slot per overlapping shard, whose pieces are joined or summed
+        self.order = []
+        # Cheapest (cost, triptime) of each shard as of the last exchange, None when the shard is empty
+        self.shard_min = [None] * self.shard_count
+        self.stopped = False
+
+    def shard_of(self, ride_num):
+        return bisect.bisect_right(self.bounds, ride_num)
+
+    def queue(self, shard, opcode, args):
+        # Add a command to a shard's batch and return its output slot
+        batch = self.pending[shard]
+        batch.append((opcode, args))
+        self.pending_count += 1
+        return shard, len(batch) - 1
+
+    def exchange(self):
+        # Send every pending batch, let the shards run them in parallel, then write the outputs in order
+        active = [shard for shard in range(self.shard_count) if self.pending[shard]]
+        for shard in active:
+            self.connections[shard].send(self.pending[shard])
+
+        outputs = [None] * self.shard_count
+        for shard in active:
+            outputs[shard], self.shard_min[shard] = self.connections[shard].recv()
+
+        for slots in self.order:
+            opcode, args = self.pending[slots[0][0]][slots[0][1]]
+            if opcode == OP_COUNT_PIECE:
+                self.sink.write_message(str(sum(outputs[shard][index] for shard, index in slots)))
+            elif opcode == OP_DISPATCH_PIECE:
+                # The shards dispatched exactly the count cheapest rides, write them in priority order
+                rides = list(heapq.merge(*(outputs[shard][index] for shard, index in slots)))
+                self.sink.write_message("\n".join(text for _, text in rides))
+                self.sink.write_repeated("No active ride requests", args[1] - len(rides))
+            elif opcode == OP_COST_PIECE:
+                rides = heapq.merge(*(outputs[shard][index] for shard, index in slots))
+                self.sink.write_message(",".join(text for _, text in rides) or "(0,0,0)")
+            elif opcode == OP_REPRICE:
+                # Every shard repriced its own rides, there is no output
+                continue
+            elif opcode == OP_TOP_PIECE:
+                # The k cheapest of the shards' k cheapest rides
+                rides = list(itertools.islice(heapq.merge(*(outputs[shard][index] for shard, index in slots)),
+                                              args[0]))
+                if rides:
+                    self.sink.write_message(",".join(text for _, text in rides))
+                else:
+                    self.sink.write_message("No active ride requests")
+            elif opcode != OP_RANGE_PIECE:
+                shard, index = slots[0]
+                text = outputs[shard][index]
+                if text == "Duplicate ride_num\n":
+                    # Same as the single process run: report the duplicate and stop
+                    self.sink.write(text)
+                    self.stopped = True
+                    break
+                if text:
+                    self.sink.write(text)
+            else:
+                pieces = [outputs[shard][index] for shard, index in slots]
+                self.sink.write(",".join(piece for piece in pieces if piece) or "(0,0,0)")
+                self.sink.write("\n")
+
+        self.pending = [[] for _ in range(self.shard_count)]
+        self.pending_count = 0
+        self.order = []
+
+    def get_next_ride(self):
+        # The shard minima must be current, so everything queued is exchanged first
+        self.exchange()
+        if self.stopped:
+            return
+
+        # Pick the shard holding the cheapest ride from the shard minima (one entry per shard, so a linear
+        # scan is as cheap as a heap); ties go to the lower shard
+        candidates = [(key, shard) for shard, key in enumerate(self.shard_min) if key is not None]
+        if not candidates:
+            self.sink.write_message("No active ride requests")
+            return
+        _, shard = min(candidates)
+        self.order.append([self.queue(shard, OP_GET_NEXT_RIDE, ())])
+        self.exchange()
+
+    def get_next_rides(self, count):
+        self.exchange()
+        if self.stopped or count <= 0:
+            return
+
+        # Find out how many of the count cheapest rides each shard holds, straight from the shards
+        for connection in self.connections:
+            connection.send([(OP_TOP_PIECE, (count,))])
+        cheapest = []
+        for shard, connection in enumerate(self.connections):
+            outputs, self.shard_min[shard] = connection.recv()
+            cheapest.append([(key, shard) for key, _ in outputs[0]])
+        taken = [0] * self.shard_count
+        for _, shard in itertools.islice(heapq.merge(*cheapest), count):
+            taken[shard] += 1
+
+        # Each shard then dispatches its share in one batch
+        slots = [self.queue(shard, OP_DISPATCH_PIECE, (taken[shard], count))
+                 for shard in range(self.shard_count) if taken[shard]]
+        if not slots:
+            self.sink.write_repeated("No active ride requests", count)
+            return
+        self.order.append(slots)
+        self.exchange()
+
+    def execute(self, opcode, args):
+        if opcode == OP_GET_NEXT_RIDE:
+            self.get_next_ride()
+            return
+        if opcode == OP_GET_NEXT_RIDES:
+            self.get_next_rides(args[0])
+            return
+
+        if opcode in (OP_PEEK_NEXT_RIDE, OP_TOP_RIDES):
+            # Every shard may hold some of the cheapest rides
+            k = 1 if opcode == OP_PEEK_NEXT_RIDE else args[0]
+            self.order.append([self.queue(shard, OP_TOP_PIECE, (k,)) for shard in range(self.shard_count)])
+        elif opcode in (OP_PRINT_BY_COST, OP_REPRICE):
+            # Costs are spread over every shard
+            piece = OP_COST_PIECE if opcode == OP_PRINT_BY_COST else OP_REPRICE
+            self.order.append([self.queue(shard, piece, args) for shard in range(self.shard_count)])
+        elif opcode in (OP_PRINT_RANGE, OP_COUNT_RIDES):
+            # Fan out only to the shards overlapping [low, high], in ride_num order
+            piece = OP_RANGE_PIECE if opcode == OP_PRINT_RANGE else OP_COUNT_PIECE
+            low, high = args
+            if low > high:
+                self.order.append([self.queue(self.shard_of(low), piece, args)])
+            else:
+                self.order.append([self.queue(shard, piece, args)
+                                   for shard in range(self.shard_of(low), self.shard_of(high) + 1)])
+        elif opcode in (OP_INSERT, OP_PRINT, OP_UPDATE_TRIP, OP_CANCEL_RIDE):
+            # Everything else concerns a single ride and goes to the shard owning it
+            self.order.append([self.queue(self.shard_of(args[0]), opcode, args)])
+        else:
+            raise ValueError(f"Unsupported opcode: {opcode}")
+
+        if self.pending_count >= MAX_PENDING_COMMANDS:
+            self.exchange()
+
+    def run(self, commands):
+        for opcode, args in commands:
+            self.execute(opcode, args)
+            if self.stopped:
+                return
+        self.exchange()
+
+    def run_lines(self, lines):
+        self.run(iter_commands(lines))
+
+    def close(self):
+        for connection in self.connections:
+            connection.send(None)
+            connection.close()
+        for process in self.processes:
+            process.join()
+
+
+def even_bounds(shards, max_ride_num):
+    # Split points dividing [0, max_ride_num] into shards ranges of the same width
+    return [max_ride_num * shard // shards + 1 for shard in range(1, shards)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="GatorTaxi dispatcher sharded over worker processes")
+    parser.add_argument("input_file", help="file containing the ride commands, - for stdin")
+    parser.add_argument("--output", default="output_file.txt",
+                        help="file the results are written to, '-' for stdout (default: output_file.txt)")
+    parser.add_argument("--shards", type=int, default=multiprocessing.cpu_count(),
+                        help="number of worker processes (default: one per CPU)")
+    parser.add_argument("--max-ride-num", type=int, default=1000000,
+                        help="ride_nums [0, N] are split evenly over the shards (default: 1000000)")
+    parser.add_argument("--bounds", type=lambda text: [int(value) for value in text.split(",")],
+                        help="explicit comma separated split points instead of --shards/--max-ride-num")
+    parser.add_argument("--heap", choices=sorted(HEAP_BACKENDS), default="binary",
+                        help="priority queue backend of every shard (default: binary)")
+    args = parser.parse_args(argv)
+
+    bounds = sorted(args.bounds) if args.bounds else even_bounds(max(args.shards, 1), args.max_ride_num)
+
+    input_file = sys.stdin if args.input_file == "-" else open(args.input_file, "r")
+    try:
+        with OutputSink(args.output, "w") as sink:
+            dispatcher = ShardedDispatcher(sink, bounds, args.heap)
+            try:
+                dispatcher.run_lines(input_file)
+            finally:
+                dispatcher.close()
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+
+
+if __name__ == "__main__":
+    main()